@@ -1,5 +1,8 @@
 from .bi_email import (
-    send_email
+    send_email,
+    send_emails,
+    email_digest,
+    register_recipients_file
 )
 
 from .bi_blob import (
@@ -13,7 +16,8 @@ from .bi_db import (
 from .bi_pbi import (
     report_refresh,
     report_refresh_noyaml,
-    send_report_as_embedded_image
+    send_report_as_embedded_image,
+    burst_report
 )
 
 from .check_flow_runs import (
@@ -31,3 +35,8 @@ try:
     from .config_vd_dsn import conn_vd
 except:
     pass
+
+try:
+    from .bi_pbi_async import AsyncPowerBiRefresh, refresh_reports_async
+except:
+    pass
@@ -1,8 +1,11 @@
-import requests  
 from prefect.blocks.system import Secret  
 import json
 from prefect.blocks.system import String
 from prefect.variables import Variable
+try:
+    from . import bi_http
+except:
+    import bi_http
 
 def blob_cleanup(blob_name):
     secret_block = Secret.load("delete-stage-blob-url")
@@ -23,7 +26,7 @@ def blob_cleanup(blob_name):
 
     # Send the post request
     headers = {'Content-Type': 'application/json'}
-    response = requests.post(url, data=json.dumps(payload), headers=headers)
+    response = bi_http.post(url, data=json.dumps(payload), headers=headers)
     
     # Print the response
     print(response.status_code, response.reason)
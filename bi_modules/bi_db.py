@@ -1,3 +1,4 @@
+import re
 from sqlalchemy import create_engine
 import snowflake.connector
 from prefect.blocks.system import String
@@ -67,6 +68,56 @@ def sf_pe_prod_connection(database: str = 'BUSINESSINTEL01'
     return connection.connect()
 
 
+################################################################################################################################
+
+def _split_table_name(table_name: str, default_database: str):
+    parts = [part.strip('"').upper() for part in table_name.split('.')]
+    if len(parts) == 2:
+        parts = [default_database.upper()] + parts
+    if len(parts) != 3 or not all(re.fullmatch(r'[A-Z0-9_$]+', part) for part in parts):
+        raise ValueError(f"Expected a table name like DATABASE.SCHEMA.TABLE or SCHEMA.TABLE, got {table_name!r}")
+    return tuple(parts)
+
+
+def get_tables_last_altered(tables: list, database: str = 'BUSINESSINTEL01', connection=None) -> dict:
+    """
+    Returns {table name as given: LAST_ALTERED} for Snowflake tables, using one query for all of them.
+
+    Args:
+        tables: Table names as DATABASE.SCHEMA.TABLE, or SCHEMA.TABLE in `database`.
+        connection: Open Snowflake connection; a new sf_pe_prod_connection() is used (and closed) if None.
+
+    Tables that don't exist (or aren't visible to the role) are left out of the result.
+    """
+    if not tables:
+        return {}
+    names = {table_name: _split_table_name(table_name, database) for table_name in set(tables)}
+    by_database = {}
+    for db, schema, table in names.values():
+        by_database.setdefault(db, set()).add((schema, table))
+
+    # Database names can't be bound as parameters; _split_table_name only lets identifiers through
+    selects = []
+    params = []
+    for db, schema_tables in sorted(by_database.items()):
+        conditions = ' OR '.join('(TABLE_SCHEMA = ? AND TABLE_NAME = ?)' for _ in schema_tables)
+        selects.append(f'SELECT TABLE_CATALOG, TABLE_SCHEMA, TABLE_NAME, LAST_ALTERED FROM "{db}".INFORMATION_SCHEMA.TABLES WHERE {conditions}')
+        for schema, table in sorted(schema_tables):
+            params += [schema, table]
+
+    close_connection = connection is None
+    if connection is None:
+        connection = sf_pe_prod_connection(database=database)
+    try:
+        rows = connection.cursor().execute(' UNION ALL '.join(selects), params).fetchall()
+    finally:
+        if close_connection:
+            connection.close()
+
+    last_altered = {(catalog.upper(), schema.upper(), table.upper()): altered for catalog, schema, table, altered in rows}
+    return {table_name: last_altered[key] for table_name, key in names.items() if key in last_altered}
+
+
 if __name__ == "__main__":
     conn = sf_pe_prod_connection()
     conn.cursor().execute('SELECT CURRENT_TIMESTAMP()').fetchone()
\ No newline at end of file
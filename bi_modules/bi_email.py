@@ -1,10 +1,24 @@
-import inspect
-from O365 import Account
+import base64
+import contextvars
+import datetime
+import json
+import mimetypes
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from O365 import Account, FileSystemTokenBackend
 from typing import List, Optional
 try:
     from .blocks import SystemConfiguration
 except:
     from blocks import SystemConfiguration
+try:
+    from . import bi_http
+except:
+    import bi_http
 import yaml
 from pathlib import Path
 from prefect.blocks.system import String
@@ -13,57 +27,181 @@ from prefect.variables import Variable
 
 
 ################################################################################################################################
+# Recipient resolution. The caller's recipients.yaml is found by walking frame globals (not
+# inspect.stack(), which reads source for every frame), remembered per calling module, and
+# parsed once per file modification; block values are loaded once per process.
+_registered_yaml_path = None
+_caller_yaml_paths = {}  # calling module file -> recipients.yaml path
+_recipients_yaml_cache = {}  # recipients.yaml path -> (mtime, parsed data)
+_block_values = {}  # String block name -> value
+_recipients_lock = threading.Lock()
+
+
+def register_recipients_file(path) -> None:
+    """Uses `path` as the recipients.yaml for every send in this process (None goes back to the caller lookup)."""
+    global _registered_yaml_path
+    _registered_yaml_path = Path(path) if path else None
+
+
+def get_block_value(block_name: str) -> str:
+    """Value of a String block, loaded once per process."""
+    with _recipients_lock:
+        if block_name not in _block_values:
+            _block_values[block_name] = String.load(block_name).value
+        return _block_values[block_name]
+
+
 def find_yaml_path():
-    stack = inspect.stack()
-    # Skip this function's frame and look for the outermost caller
+    if _registered_yaml_path is not None:
+        return _registered_yaml_path
+    # Skip this function's frame and look for the nearest caller
     # that's not part of the bi_modules package
-    for frame in stack[1:]:
-        module = inspect.getmodule(frame[0])
-        if module is None:
-            continue
-        
-        module_file = module.__file__
-        if module_file and Path(module_file).name != '<stdin>':
-            module_path = Path(module_file)
-            # Check if this module is NOT from bi_modules (i.e., it's a user script)
-            if 'bi_modules' not in str(module_path):
-                print(f"Found caller path: {module_path.parent / 'recipients.yaml'}")
-                return module_path.parent / 'recipients.yaml'
+    frame = sys._getframe(1)
+    while frame is not None:
+        module_file = frame.f_globals.get('__file__')
+        # Check if this module is NOT from bi_modules (i.e., it's a user script)
+        if module_file and 'bi_modules' not in module_file:
+            yaml_path = _caller_yaml_paths.get(module_file)
+            if yaml_path is None:
+                yaml_path = Path(module_file).parent / 'recipients.yaml'
+                _caller_yaml_paths[module_file] = yaml_path
+                print(f"Found caller path: {yaml_path}")
+            return yaml_path
+        frame = frame.f_back
     
     # If we can't determine caller path or caller is from bi_modules, return current working directory
-    print(f"Using fallback path: {Path('./recipients.yaml').absolute()}")
     return Path('./recipients.yaml')
 
+
+def load_recipients_yaml(yaml_path=None):
+    """Parsed recipients.yaml (the caller's by default), re-read only when the file changes; None if missing."""
+    yaml_path = Path(yaml_path) if yaml_path else find_yaml_path()
+    try:
+        mtime = yaml_path.stat().st_mtime
+    except OSError:
+        return None
+    key = str(yaml_path.absolute())
+    cached = _recipients_yaml_cache.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with open(yaml_path, 'r') as f:
+        data = yaml.safe_load(f)
+    _recipients_yaml_cache[key] = (mtime, data)
+    return data
+
+
 def get_recipients_from_yaml():
     """
     Try to load recipients from a yaml file
     Returns list of recipients if file exists and contains valid data, None otherwise
     """
     try:
-        yaml_path = find_yaml_path()
-        if yaml_path.exists():
-            with open(yaml_path, 'r') as f:
-                data = yaml.safe_load(f)
-                if isinstance(data, dict) and 'recipients' in data:
-                    return data['recipients']
+        data = load_recipients_yaml()
+        if isinstance(data, dict) and 'recipients' in data:
+            return data['recipients']
     except Exception as e:
         print(f"Error loading recipients from yaml: {e}")
     return None
 
-def login() -> Account:
-    system_configuration_block = SystemConfiguration.load("datateam-email-credentials", validate=False)
-    system_secrets = system_configuration_block.system_secrets.get_secret_value()
 
-    account = Account(
-        credentials=(system_secrets['client_id'], system_secrets['client_secret']),
-        auth_flow_type='credentials',
-        tenant_id=system_secrets['tenant_id'],
-        main_resource= String.load("datateam-email").value
-    )
-    
-    assert account.authenticate(), 'Authentication Error'
-    print('Authenticated')
-    return account
+def get_recipient_groups() -> dict:
+    """
+    Named recipient groups from the `groups` section of recipients.yaml, e.g.
+        groups:
+          finance: [a@test.com, b@test.com]
+    """
+    try:
+        data = load_recipients_yaml()
+    except Exception as e:
+        print(f"Error loading recipients from yaml: {e}")
+        return {}
+    groups = data.get('groups') if isinstance(data, dict) else None
+    return groups or {}
+
+EMAIL_CREDENTIALS_BLOCK = "datateam-email-credentials"
+EMAIL_MAILBOX_BLOCK = "datateam-email"
+EMAIL_TOKEN_DIR_ENV = "O365_TOKEN_DIR"
+
+
+def is_unauthorized(error: Exception) -> bool:
+    """True when a Graph call failed with 401 (the O365 library raises requests.HTTPError)."""
+    response = getattr(error, 'response', None)
+    return response is not None and getattr(response, 'status_code', None) == 401
+
+
+class EmailAccountManager:
+    """
+    Keeps one authenticated O365 Account per process.
+
+    The credentials block and mailbox are loaded once, and the Graph token is reused until it is
+    `refresh_margin` seconds from expiring. With `token_dir` (or $O365_TOKEN_DIR) the token is
+    kept in a file there, so parallel workers on the same host pick up the token the first one
+    fetched instead of each running the client-credentials flow. A lock makes sure only one
+    thread authenticates at a time.
+    """
+    def __init__(self, credentials_block: str = EMAIL_CREDENTIALS_BLOCK, mailbox_block: str = EMAIL_MAILBOX_BLOCK, token_dir: str = None, refresh_margin: int = 300):
+        self.credentials_block = credentials_block
+        self.mailbox_block = mailbox_block
+        self.token_dir = token_dir or os.environ.get(EMAIL_TOKEN_DIR_ENV)
+        self.refresh_margin = refresh_margin
+        self._account = None
+        self._lock = threading.Lock()
+
+    def _build_account(self) -> Account:
+        system_configuration_block = SystemConfiguration.load(self.credentials_block, validate=False)
+        system_secrets = system_configuration_block.system_secrets.get_secret_value()
+        kwargs = {}
+        if self.token_dir:
+            Path(self.token_dir).mkdir(parents=True, exist_ok=True)
+            kwargs['token_backend'] = FileSystemTokenBackend(
+                token_path=self.token_dir,
+                token_filename=f"o365_token_{system_secrets['client_id']}.txt"
+            )
+        return Account(
+            credentials=(system_secrets['client_id'], system_secrets['client_secret']),
+            auth_flow_type='credentials',
+            tenant_id=system_secrets['tenant_id'],
+            main_resource=get_block_value(self.mailbox_block),
+            **kwargs
+        )
+
+    def _needs_token(self, account: Account) -> bool:
+        # is_authenticated also loads a token another worker saved to the shared backend
+        if not account.is_authenticated:
+            return True
+        token_backend = account.con.token_backend
+        if not hasattr(token_backend, 'token_expiration_datetime'):
+            return False
+        expires = token_backend.token_expiration_datetime(username=account.con.username)
+        return expires is None or (expires - datetime.datetime.now()).total_seconds() < self.refresh_margin
+
+    def get_account(self, force: bool = False) -> Account:
+        """Returns the cached account, authenticating only when there is no usable token (or `force`)."""
+        with self._lock:
+            if self._account is None:
+                self._account = self._build_account()
+            if force or self._needs_token(self._account):
+                assert self._account.authenticate(), 'Authentication Error'
+                print('Authenticated')
+            return self._account
+
+
+_email_account_manager = None
+_email_account_manager_lock = threading.Lock()
+
+
+def get_email_account_manager() -> EmailAccountManager:
+    """Returns the process-wide EmailAccountManager."""
+    global _email_account_manager
+    with _email_account_manager_lock:
+        if _email_account_manager is None:
+            _email_account_manager = EmailAccountManager()
+        return _email_account_manager
+
+
+def login(force_refresh: bool = False) -> Account:
+    """Returns the shared authenticated Account (see EmailAccountManager)."""
+    return get_email_account_manager().get_account(force=force_refresh)
 
 
 def read_inbox() -> None:
@@ -76,6 +214,120 @@ def read_inbox() -> None:
     
 ################################################################################################################################
 
+def resolve_recipients(email=None) -> list:
+    """
+    The explicit recipient(s), else the nearby recipients.yaml, else the datateam-email block.
+    Entries without an '@', given explicitly or listed under `recipients` in the yaml, name a
+    group from the `groups` section of recipients.yaml.
+    """
+    if email is None:
+        # Try to get recipients from yaml file
+        entries = get_recipients_from_yaml()
+        if not entries:
+            return [get_block_value(EMAIL_MAILBOX_BLOCK)]
+    else:
+        entries = [email] if isinstance(email, str) else email
+    recipients = []
+    groups = None
+    for entry in entries:
+        if '@' in entry:
+            if entry not in recipients:
+                recipients.append(entry)
+            continue
+        groups = get_recipient_groups() if groups is None else groups
+        if entry not in groups:
+            raise ValueError(f"Recipient group {entry!r} not found in recipients.yaml")
+        recipients.extend(address for address in groups[entry] if address not in recipients)
+    return recipients
+
+
+def prepare_email(subject: str, body: str, email=None, message_status: str = None):
+    """
+    Resolves the recipients and applies the QA redirect and the message_status formatting of
+    send_email. Returns (recipients, subject, body_formatted).
+    """
+    recipients = resolve_recipients(email)
+    
+    env = Variable.get("env")
+    if env == 'QA':
+        recipients = [get_block_value(EMAIL_MAILBOX_BLOCK)]
+        subject += ' - DEBUG MODE'
+    
+    # Format body based on message status if provided
+    if message_status == 'Success':
+        body_formatted = f"""
+            <div style="font-family: Arial, sans-serif; border: 2px solid #4CAF50; padding: 16px; border-radius: 8px; background-color: #DFF2BF;">
+                <h2 style="color: #4CAF50;">Success:</h2>
+                <h3 style="color: #4CAF50;">Log Contents:</h3>
+                <div style="overflow-x: auto;">{body}</div>
+                <br>
+            </div>
+            """
+    elif message_status == 'Error':
+        body_formatted = f"""
+        <div style="font-family: Arial, sans-serif; border: 2px solid #FF0000; padding: 16px; border-radius: 8px; background-color: #FFCFCF;">
+            <h2 style="color: #FF0000;">Error Log Contents:</h2>
+            <h4 style="overflow-x: auto;">{body}</h4>
+        </div>
+        """
+    elif message_status == 'Warning':
+        body_formatted = f"""
+            <div style="font-family: Arial, sans-serif; border: 2px solid #FFC107; padding: 16px; border-radius: 8px; background-color: #FFF9C4;">
+                <h2 style="color: #FFC107;">Warning:</h2>
+                <p style="font-size: 18px;">{body}</p>
+            </div>
+        """
+    else:
+        body_formatted = body
+
+    return recipients, subject, body_formatted
+
+
+LARGE_ATTACHMENT_BYTES = 3 * 1024 * 1024  # Graph rejects attachments above 3 MB in a single request
+UPLOAD_CHUNK_BYTES = 10 * 320 * 1024  # upload session chunks must be a multiple of 320 KiB and under 4 MB
+MAX_UPLOAD_WORKERS = 4
+
+
+def is_large_attachment(path: str) -> bool:
+    return os.path.getsize(path) > LARGE_ATTACHMENT_BYTES
+
+
+def upload_attachment(message, path: str, content_id: str = None, chunk_size: int = UPLOAD_CHUNK_BYTES) -> None:
+    """
+    Attaches a file to a saved draft through a Graph upload session, reading it from disk one
+    chunk at a time so the file is never held in memory or base64-encoded whole.
+    """
+    size = os.path.getsize(path)
+    name = Path(path).name
+    item = {"attachmentType": "file", "name": name, "size": size}
+    if content_id:
+        item.update(isInline=True, contentId=content_id)
+    url = message.build_url(f"/messages/{message.object_id}/attachments/createUploadSession")
+    upload_url = message.con.post(url, data={"AttachmentItem": item}).json()['uploadUrl']
+
+    offset = 0
+    with open(path, 'rb') as f:
+        while offset < size:
+            chunk = f.read(chunk_size)
+            headers = {
+                'Content-Type': 'application/octet-stream',
+                'Content-Range': f"bytes {offset}-{offset + len(chunk) - 1}/{size}"
+            }
+            # The upload URL is pre-authenticated and must not be sent an Authorization header
+            response = bi_http.request("PUT", upload_url, data=chunk, headers=headers)
+            if response.status_code not in (200, 201):
+                raise RuntimeError(f"Uploading {name} failed at byte {offset}: {response.status_code} {response.text}")
+            offset += len(chunk)
+    print(f"Uploaded {name} ({size} bytes) in {-(-size // chunk_size)} chunk(s)")
+
+
+def upload_attachments(message, paths: list, content_ids: dict = None, max_workers: int = MAX_UPLOAD_WORKERS) -> None:
+    """Uploads several large attachments to a saved draft concurrently."""
+    content_ids = content_ids or {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(paths)))) as executor:
+        list(executor.map(lambda path: upload_attachment(message, path, content_ids.get(path)), paths))
+
+
 def send_email(
     subject: str,
     body: str,
@@ -95,8 +347,11 @@ def send_email(
         body (str): Email body content in HTML format. Can include HTML tags for formatting.
         attachments (list, optional): List of file paths to attach to the email.
             Example: ['path/to/file1.pdf', 'path/to/file2.xlsx']
+            Files over 3 MB are uploaded to a draft in chunks (streamed from disk, several at
+            once) and the draft is then sent.
         email (str or list, optional): Recipient email address(es). Can be a single email string
-            or a list of email addresses. If None, the function will:
+            or a list of email addresses; a name without '@' is expanded from the `groups`
+            section of recipients.yaml. If None, the function will:
             1. Try to load recipients from a nearby 'recipients.yaml' file
             2. Fall back to the default email from "datateam-email" String block
         content_ids (dict, optional): Dictionary mapping attachment file paths to content IDs
@@ -108,6 +363,8 @@ def send_email(
             - 'Error': Red border with error header
             - 'Warning': Yellow border with warning header
             - None: No special formatting, body sent as-is
+            Inside an email_digest block, emails with a status and no attachments are buffered
+            and sent as one grouped digest per recipient set and status.
     
     Environment Behavior:
         - In QA environment (when Variable.get("env") == 'QA'):
@@ -142,64 +399,31 @@ def send_email(
             message_status="Warning"
         )
     """
+    digest = _active_digest.get()
+    if digest is not None and message_status is not None and not attachments:
+        digest.add(subject, body, email, message_status)
+        return
+
     with concurrency("email_concurrency", occupy=1):
         account = login()
         
         # Create and send email
         m = account.new_message()
         
-        # Handle recipients
-        if email is not None:
-            recipients = [email] if isinstance(email, str) else email
-        else:
-            # Try to get recipients from yaml file
-            yaml_recipients = get_recipients_from_yaml()
-            if yaml_recipients:
-                recipients = yaml_recipients
-            else:
-                recipients = [String.load("datateam-email").value]
-                
-        env = Variable.get("env")
-        if env == 'QA':
-            recipients = [String.load("datateam-email").value]
-            subject += ' - DEBUG MODE'
-            
+        # Handle recipients and format body based on message status if provided
+        recipients, subject, body_formatted = prepare_email(subject, body, email, message_status)
         m.to.add(recipients)
         m.subject = subject
 
-        # Format body based on message status if provided
-        if message_status == 'Success':
-            body_formatted = f"""
-                <div style="font-family: Arial, sans-serif; border: 2px solid #4CAF50; padding: 16px; border-radius: 8px; background-color: #DFF2BF;">
-                    <h2 style="color: #4CAF50;">Success:</h2>
-                    <h3 style="color: #4CAF50;">Log Contents:</h3>
-                    <div style="overflow-x: auto;">{body}</div>
-                    <br>
-                </div>
-                """
-        elif message_status == 'Error':
-            body_formatted = f"""
-            <div style="font-family: Arial, sans-serif; border: 2px solid #FF0000; padding: 16px; border-radius: 8px; background-color: #FFCFCF;">
-                <h2 style="color: #FF0000;">Error Log Contents:</h2>
-                <h4 style="overflow-x: auto;">{body}</h4>
-            </div>
-            """
-        elif message_status == 'Warning':
-            body_formatted = f"""
-                <div style="font-family: Arial, sans-serif; border: 2px solid #FFC107; padding: 16px; border-radius: 8px; background-color: #FFF9C4;">
-                    <h2 style="color: #FFC107;">Warning:</h2>
-                    <p style="font-size: 18px;">{body}</p>
-                </div>
-            """
-        else:
-            body_formatted = body
-
         m.body = body_formatted
         m.body_type = 'HTML'
 
         # Handle attachments with content IDs for inline images
+        large_attachments = [attachment for attachment in attachments or [] if is_large_attachment(attachment)]
         if attachments:
             for attachment in attachments:
+                if attachment in large_attachments:
+                    continue
                 # If this attachment has a content ID, set it as inline
                 if content_ids and attachment in content_ids:
                     m.attachments.add(attachment)
@@ -211,8 +435,374 @@ def send_email(
                 else:
                     # Regular attachment
                     m.attachments.add(attachment)
+
+        if large_attachments:
+            # Too big for one request: save a draft, upload the large files to it, then send the draft
+            m.save_draft()
+            try:
+                upload_attachments(m, large_attachments, content_ids)
+            except Exception:
+                m.delete()
+                raise
         
-        m.send()
+        try:
+            m.send()
+        except Exception as e:
+            if not is_unauthorized(e):
+                raise
+            # The cached token was revoked or expired early; authenticate again and retry once
+            print("Graph rejected the token, re-authenticating...")
+            login(force_refresh=True)
+            m.send()
+
+GRAPH_BATCH_LIMIT = 20  # requests per Graph $batch call
+GRAPH_BATCH_MAX_BYTES = 3 * 1024 * 1024  # keeps each $batch body under Graph's 4 MB request limit
+GRAPH_BATCH_RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def build_graph_message(subject: str, body: str, recipients: list, attachments: list = None, content_ids: dict = None) -> dict:
+    """The Graph sendMail `message` resource for an HTML email, with attachments inlined as base64."""
+    message = {
+        "subject": subject,
+        "body": {"contentType": "HTML", "content": body},
+        "toRecipients": [{"emailAddress": {"address": address}} for address in recipients],
+    }
+    if attachments:
+        message["attachments"] = []
+        for attachment in attachments:
+            path = Path(attachment)
+            file_attachment = {
+                "@odata.type": "#microsoft.graph.fileAttachment",
+                "name": path.name,
+                "contentType": mimetypes.guess_type(path.name)[0] or "application/octet-stream",
+                "contentBytes": base64.b64encode(path.read_bytes()).decode(),
+            }
+            if content_ids and attachment in content_ids:
+                file_attachment["isInline"] = True
+                file_attachment["contentId"] = content_ids[attachment]
+            message["attachments"].append(file_attachment)
+    return message
+
+
+def estimate_graph_message_bytes(body: str, attachments: list = None) -> int:
+    """Approximate JSON size of a sendMail request: the body plus base64 attachments (4 bytes per 3) and some overhead."""
+    return len(body.encode()) + 1024 + sum(-(-os.path.getsize(attachment) // 3) * 4 + 512 for attachment in attachments or [])
+
+
+def _batch_chunks(indexes: list, sizes: dict):
+    """Splits message indexes into $batch calls of at most GRAPH_BATCH_LIMIT requests and GRAPH_BATCH_MAX_BYTES."""
+    chunk = []
+    chunk_bytes = 0
+    for index in indexes:
+        if chunk and (len(chunk) == GRAPH_BATCH_LIMIT or chunk_bytes + sizes[index] > GRAPH_BATCH_MAX_BYTES):
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+        chunk.append(index)
+        chunk_bytes += sizes[index]
+    if chunk:
+        yield chunk
+
+
+def send_emails(messages: list, max_retries: int = 3) -> list:
+    """
+    Sends many emails through Graph JSON batching: up to 20 sendMail requests per HTTP call,
+    all under a single "email_concurrency" slot and one login. Batches are also cut by size, and
+    attachments are only read and encoded for the batch being sent.
+
+    Args:
+        messages: List of dicts with the keyword arguments of send_email (subject, body,
+            attachments, email, content_ids, message_status). Recipients, QA redirect and status
+            formatting are resolved exactly as send_email does. Messages too big to share a
+            batch (over 3 MB with their attachments) are sent one by one through send_email.
+        max_retries: How many times messages that failed with a throttling or server error are
+            resubmitted (only those messages are retried).
+
+    Returns:
+        One {'subject', 'status': 'Sent' or 'Failed', 'error'} per message, in `messages` order.
+
+    Example:
+        send_emails([
+            {"subject": "NC sales", "body": "<p>...</p>", "email": "nc@test.com", "attachments": ["nc.pdf"]},
+            {"subject": "SC sales", "body": "<p>...</p>", "email": "sc@test.com", "attachments": ["sc.pdf"]},
+        ])
+    """
+    results = [{'subject': message.get('subject'), 'status': 'Failed', 'error': None} for message in messages]
+    prepared = {}  # index -> build_graph_message arguments
+    sizes = {}
+    for index, message in enumerate(messages):
+        try:
+            recipients, subject, body_formatted = prepare_email(message['subject'], message['body'], message.get('email'), message.get('message_status'))
+            size = estimate_graph_message_bytes(body_formatted, message.get('attachments'))
+            if size > GRAPH_BATCH_MAX_BYTES:
+                send_email(**message)
+                results[index]['status'] = 'Sent'
+                continue
+        except Exception as e:
+            results[index]['error'] = str(e)
+            continue
+        prepared[index] = (subject, body_formatted, recipients, message.get('attachments'), message.get('content_ids'))
+        sizes[index] = size
+
+    with concurrency("email_concurrency", occupy=1):
+        account = login()
+        batch_url = f"{account.protocol.service_url}$batch"
+        send_url = f"/users/{account.main_resource}/sendMail"
+        pending = sorted(prepared)
+        for attempt in range(max_retries + 1):
+            retry = []
+            retry_after = 0
+            for chunk in _batch_chunks(pending, sizes):
+                bodies = {}
+                for index in list(chunk):
+                    try:
+                        bodies[index] = {"message": build_graph_message(*prepared[index]), "saveToSentItems": True}
+                    except Exception as e:
+                        results[index]['error'] = str(e)
+                        chunk.remove(index)
+                if not chunk:
+                    continue
+                batch = {"requests": [
+                    {
+                        "id": str(index),
+                        "method": "POST",
+                        "url": send_url,
+                        "headers": {"Content-Type": "application/json"},
+                        "body": bodies[index]
+                    } for index in chunk
+                ]}
+                try:
+                    response = account.con.post(batch_url, data=batch)
+                except Exception as e:
+                    if is_unauthorized(e):
+                        account = login(force_refresh=True)
+                    print(f"Email batch of {len(chunk)} failed: {str(e)}")
+                    for index in chunk:
+                        results[index]['error'] = str(e)
+                    retry.extend(chunk)
+                    continue
+                for item in response.json().get('responses', []):
+                    index = int(item['id'])
+                    status = int(item.get('status', 0))
+                    if 200 <= status < 300:
+                        results[index].update(status='Sent', error=None)
+                        continue
+                    error = (item.get('body') or {}).get('error', {})
+                    results[index]['error'] = f"{status}: {error.get('message', 'send failed')}"
+                    if status in GRAPH_BATCH_RETRY_STATUS_CODES:
+                        retry.append(index)
+                        retry_after = max(retry_after, int((item.get('headers') or {}).get('Retry-After', 0) or 0))
+
+            sent = sum(1 for result in results if result['status'] == 'Sent')
+            print(f"Email batch pass {attempt + 1}: {sent} of {len(messages)} sent, {len(retry)} to retry")
+            if not retry or attempt == max_retries:
+                break
+            time.sleep(max(retry_after, 2 ** attempt))
+            pending = sorted(retry)
+    return results
+
+
+try:
+    import fcntl
+
+    def _lock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _unlock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+except ImportError:
+    import msvcrt
+
+    def _lock_file(f):
+        f.seek(0)
+        while True:
+            try:
+                # LK_LOCK gives up after about 10 seconds, keep waiting
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+
+    def _unlock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class EmailDigest:
+    """
+    Buffers status emails and sends one grouped message per recipient set and status.
+
+    While a digest is active (see email_digest), send_email calls with a `message_status` and no
+    attachments are added here instead of being sent. flush() merges everything buffered into
+    one email per (recipients, status), sent together through send_emails.
+
+    Args:
+        window_seconds: When set, the buffer is flushed once its oldest entry is this old, checked
+            on every add and when the email_digest block ends. None means flush only when the
+            email_digest block ends (one digest per flow run).
+        store_path: JSON file holding the buffer, so a window can span several flow runs on the
+            same host. It is guarded by a lock file next to it, so concurrent workers can share
+            it. Without it the buffer lives in memory.
+    """
+    def __init__(self, window_seconds: int = None, store_path: str = None):
+        self.window_seconds = window_seconds
+        self.store_path = Path(store_path) if store_path else None
+        self._entries = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        """Holds the thread lock, plus an exclusive lock on <store_path>.lock when the buffer is on disk."""
+        with self._lock:
+            if self.store_path is None:
+                yield
+                return
+            self.store_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.store_path.with_name(self.store_path.name + '.lock'), 'a+') as lock_file:
+                _lock_file(lock_file)
+                try:
+                    yield
+                finally:
+                    _unlock_file(lock_file)
+
+    def _load(self) -> list:
+        if self.store_path is None:
+            return self._entries
+        try:
+            with open(self.store_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def _save(self, entries: list):
+        if self.store_path is None:
+            self._entries = entries
+            return
+        tmp_path = self.store_path.with_name(f".{self.store_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.store_path)
+
+    def add(self, subject: str, body: str, email=None, message_status: str = None):
+        entry = {
+            'time': time.time(),
+            'subject': subject,
+            'body': body,
+            'recipients': sorted(resolve_recipients(email)),
+            'status': message_status,
+        }
+        self._append([entry])
+        if self.due():
+            self.flush()
+
+    def _append(self, entries: list):
+        with self._locked():
+            self._save(self._load() + entries)
+
+    def pending(self) -> int:
+        with self._locked():
+            return len(self._load())
+
+    def due(self) -> bool:
+        """True when the window is set and the oldest buffered entry has reached it."""
+        if self.window_seconds is None:
+            return False
+        with self._locked():
+            entries = self._load()
+        return bool(entries) and time.time() - min(entry['time'] for entry in entries) >= self.window_seconds
+
+    @staticmethod
+    def group_entries(entries: list) -> dict:
+        """{(recipients, status): [entries]}, oldest first."""
+        groups = {}
+        for entry in sorted(entries, key=lambda entry: entry['time']):
+            groups.setdefault((tuple(entry['recipients']), entry['status']), []).append(entry)
+        return groups
+
+    @classmethod
+    def build_messages(cls, entries: list) -> list:
+        """Groups entries by (recipients, status) into send_emails message dicts, oldest first."""
+        messages = []
+        for (recipients, status), group in cls.group_entries(entries).items():
+            if len(group) == 1:
+                subject = group[0]['subject']
+                body = group[0]['body']
+            else:
+                subject = f"{len(group)} {status or 'notification'} messages: {group[0]['subject']}"
+                sections = [
+                    f"<h3>{entry['subject']} <small>({datetime.datetime.fromtimestamp(entry['time']).strftime('%Y-%m-%d %H:%M:%S')})</small></h3>"
+                    f"<div>{entry['body']}</div>"
+                    for entry in group
+                ]
+                body = "<hr>".join(sections)
+            messages.append({'subject': subject, 'body': body, 'email': list(recipients), 'message_status': status})
+        return messages
+
+    def flush(self) -> list:
+        """
+        Sends everything buffered as grouped emails and returns the send_emails results. The
+        entries are taken out of the buffer while they are sent (so another worker flushing the
+        same store doesn't send them twice) and the ones whose email failed are put back.
+        """
+        with self._locked():
+            entries = self._load()
+            self._save([])
+        if not entries:
+            return []
+        groups = list(self.group_entries(entries).values())
+        messages = self.build_messages(entries)
+        print(f"Sending email digest: {len(entries)} notifications in {len(messages)} emails")
+        # Messages send_emails hands to send_email must not be buffered into a digest again
+        token = _active_digest.set(None)
+        try:
+            results = send_emails(messages)
+        except Exception:
+            self._append(entries)
+            raise
+        finally:
+            _active_digest.reset(token)
+        failed = [entry for group, result in zip(groups, results) if result['status'] != 'Sent' for entry in group]
+        if failed:
+            print(f"Email digest: {len(failed)} notifications could not be sent and stay buffered")
+            self._append(failed)
+        return results
+
+
+_active_digest = contextvars.ContextVar('email_digest', default=None)
+
+
+@contextmanager
+def email_digest(window_seconds: int = None, store_path: str = None):
+    """
+    Buffers status emails sent inside the block into grouped digests (see EmailDigest).
+
+    Without a window the digest is sent when the block ends, e.g. wrapping a flow body gives
+    one email per recipient set and status for the whole run. With `window_seconds` alone,
+    digests are sent as the window passes and whatever is left when the block ends. With
+    `window_seconds` and a `store_path`, entries are only sent once the window has passed,
+    possibly by a later run.
+
+    The digest is held in a context variable, so it only collects emails sent from the code
+    inside the block: other threads and concurrent flow runs keep sending (or use their own
+    digest), and worker threads started inside the block send directly.
+
+    Example:
+        with email_digest():
+            for task in failed_tasks:
+                send_email(subject=f"{task} failed", body=log, message_status='Error')
+    """
+    digest = EmailDigest(window_seconds, store_path)
+    token = _active_digest.set(digest)
+    try:
+        yield digest
+    finally:
+        _active_digest.reset(token)
+        # An in-memory buffer ends with the block, so it is always sent; a stored one waits for its window
+        if store_path is None or window_seconds is None or digest.due():
+            digest.flush()
+        if store_path is None and digest.pending():
+            print(f"Email digest: {digest.pending()} notifications were not sent")
+
 
 if __name__ == "__main__":
     send_email(subject='Test',body='Test',attachments=['recipients.yaml','reports.yaml'],message_status='Warning')
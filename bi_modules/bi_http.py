@@ -0,0 +1,245 @@
+import email.utils
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+
+################################################################################################################################
+# Shared HTTP layer for every REST call made by bi_modules.
+#
+# One requests.Session is kept per process so TCP/TLS connections are reused (keep-alive)
+# instead of being re-established on every call. Connection errors, timeouts and 5xx responses
+# are retried with jittered exponential backoff, a 401 asks the caller's token provider for a
+# fresh token before trying once more, and a 429 waits for the Retry-After the server asked for.
+# Non-idempotent requests (POST, PATCH) are retried only on connection errors unless the caller
+# passes retry_non_idempotent=True.
+
+DEFAULT_POOL_SIZE = 20
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_BASE = 2  # seconds
+DEFAULT_BACKOFF_MAX = 60  # seconds
+DEFAULT_TIMEOUT = (10, 300)  # (connect, read) seconds
+DEFAULT_MAX_THROTTLE_RETRIES = 10
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+_settings = {
+    'pool_size': DEFAULT_POOL_SIZE,
+    'max_retries': DEFAULT_MAX_RETRIES,
+    'backoff_base': DEFAULT_BACKOFF_BASE,
+    'backoff_max': DEFAULT_BACKOFF_MAX,
+}
+_session = None
+_session_lock = threading.Lock()
+
+
+def configure(pool_size: int = None, max_retries: int = None, backoff_base: float = None, backoff_max: float = None):
+    """
+    Changes the pool size and retry policy. Changing the pool size replaces the shared session,
+    so call this once at the start of a flow before issuing requests.
+    """
+    global _session
+    with _session_lock:
+        if pool_size is not None and pool_size != _settings['pool_size']:
+            _settings['pool_size'] = pool_size
+            if _session is not None:
+                _session.close()
+                _session = None
+        if max_retries is not None:
+            _settings['max_retries'] = max_retries
+        if backoff_base is not None:
+            _settings['backoff_base'] = backoff_base
+        if backoff_max is not None:
+            _settings['backoff_max'] = backoff_max
+
+
+def configured_max_retries() -> int:
+    """The retry count set with configure(), used when a caller doesn't pass max_retries."""
+    return _settings['max_retries']
+
+
+def get_session() -> requests.Session:
+    """Returns the process-wide pooled session. The session is shared by all threads."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=_settings['pool_size'], pool_maxsize=_settings['pool_size'])
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff: a random delay up to base * 2^attempt, capped at backoff_max."""
+    return random.uniform(0, min(_settings['backoff_max'], _settings['backoff_base'] * (2 ** attempt)))
+
+
+def retry_after_seconds(response, default: float = None) -> float:
+    """Parses a Retry-After header given either as seconds or as an HTTP date."""
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class RetryState:
+    """
+    The retry, 401 and 429 decisions for one logical request, shared by request() and
+    bi_pbi_async.async_request so the sync and async clients can't drift apart. The caller
+    does the I/O and the waiting; after each attempt it asks on_error() or on_response() what to
+    do next, and calls record() with the final outcome.
+    """
+    def __init__(self, method: str, url: str, max_retries: int, retry_status_codes: tuple, max_throttle_retries: int, can_refresh_token: bool = False, rate_limited: bool = False, retry_non_idempotent: bool = False):
+        self.method = method
+        self.idempotent = retry_non_idempotent or method.upper() in IDEMPOTENT_METHODS
+        self.url = url
+        self.max_retries = max_retries
+        self.retry_status_codes = retry_status_codes
+        self.max_throttle_retries = max_throttle_retries
+        self.can_refresh_token = can_refresh_token
+        self.rate_limited = rate_limited
+        self.attempt = 0
+        self.throttled = 0
+        self.refreshed_token = False
+        self.started = time.perf_counter()
+
+    def on_error(self, error: Exception, connect_error: bool = False) -> float:
+        """
+        Seconds to wait before retrying after a connection error or timeout, or None to give up
+        and re-raise. A non-idempotent request is only retried when `connect_error` says it
+        never reached the server: after a read timeout the work (an export, a refresh) may
+        already have started.
+        """
+        if self.attempt >= self.max_retries or not (self.idempotent or connect_error):
+            return None
+        delay = backoff_delay(self.attempt)
+        print(f"{self.method} {self.url} failed ({error}), retrying in {delay:.1f}s")
+        self.attempt += 1
+        return delay
+
+    def on_response(self, response):
+        """
+        Returns (action, seconds): ('refresh_token', 0) after the first 401, ('throttled', seconds)
+        for a 429, ('retry', seconds) for a retryable status, or ('done', 0) when the response is final.
+        """
+        if response.status_code == 401 and self.can_refresh_token and not self.refreshed_token:
+            print("Token expired, refreshing...")
+            self.refreshed_token = True
+            return 'refresh_token', 0
+        if response.status_code == 429 and self.throttled < self.max_throttle_retries:
+            delay = retry_after_seconds(response, default=backoff_delay(self.throttled + 1))
+            self.throttled += 1
+            if not self.rate_limited:
+                print(f"{self.method} {self.url} was throttled, retrying in {delay:.1f}s")
+            return 'throttled', delay
+        if response.status_code in self.retry_status_codes and self.attempt < self.max_retries and self.idempotent:
+            delay = backoff_delay(self.attempt)
+            print(f"{self.method} {self.url} returned {response.status_code}, retrying in {delay:.1f}s")
+            self.attempt += 1
+            return 'retry', delay
+        return 'done', 0
+
+    def record(self, metrics, response=None):
+        """Reports the request to `metrics` (see bi_pbi_metrics.RunMetrics.record_call); no response means it failed to connect."""
+        if metrics is None:
+            return
+        if response is None:
+            metrics.record_call(self.method, self.url, None, time.perf_counter() - self.started, self.attempt, self.throttled)
+            return
+        content_length = response.headers.get('Content-Length')
+        metrics.record_call(self.method, self.url, response.status_code, time.perf_counter() - self.started, self.attempt, self.throttled,
+                            int(content_length) if content_length and content_length.isdigit() else None)
+
+
+def request(
+    method: str,
+    url: str,
+    token_provider=None,
+    max_retries: int = None,
+    retry_status_codes: tuple = RETRY_STATUS_CODES,
+    rate_limiter=None,
+    max_throttle_retries: int = DEFAULT_MAX_THROTTLE_RETRIES,
+    metrics=None,
+    retry_non_idempotent: bool = False,
+    **kwargs
+) -> requests.Response:
+    """
+    Sends a request through the pooled session and returns the final response.
+
+    Args:
+        method: HTTP method, e.g. "GET" or "POST".
+        url: Full request URL.
+        token_provider: Optional callable returning the Authorization header value. It is called
+            as token_provider() before the first attempt and as token_provider(stale_token=<value>)
+            after a 401, and the request is repeated once with the new value.
+        max_retries: Retries for connection errors and `retry_status_codes` (defaults to the
+            configured value). POST and PATCH are only retried on connection failures, since a
+            timeout or 5xx doesn't tell whether the server already acted on them.
+        rate_limiter: Optional object with acquire(method, url), called before every attempt, and
+            on_throttled(method, url, seconds), called when the server answers 429
+            (see bi_pbi_governor.PowerBiGovernor).
+        max_throttle_retries: How many 429 responses to wait out before returning the last one.
+        metrics: Optional object with record_call(method, url, status_code, seconds, retries,
+            throttled, bytes), called once per request with the total time including retries
+            (see bi_pbi_metrics.RunMetrics).
+        retry_non_idempotent: Retry a POST/PATCH on timeouts and `retry_status_codes` too, for
+            requests that are safe to repeat (token requests, read-only queries).
+        **kwargs: Passed through to requests (headers, json, data, params, stream, timeout...).
+
+    Raises:
+        requests.RequestException: when the connection still fails after the last retry.
+    """
+    if max_retries is None:
+        max_retries = configured_max_retries()
+    kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+    headers = dict(kwargs.pop('headers', None) or {})
+    session = get_session()
+
+    if token_provider is not None:
+        headers['Authorization'] = token_provider()
+
+    retry = RetryState(method, url, max_retries, retry_status_codes, max_throttle_retries, token_provider is not None, rate_limiter is not None, retry_non_idempotent)
+    while True:
+        if rate_limiter is not None:
+            rate_limiter.acquire(method, url)
+        try:
+            response = session.request(method, url, headers=headers, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            delay = retry.on_error(e, connect_error=isinstance(e, requests.ConnectionError))
+            if delay is None:
+                retry.record(metrics)
+                raise
+            time.sleep(delay)
+            continue
+
+        action, delay = retry.on_response(response)
+        if action == 'done':
+            retry.record(metrics, response)
+            return response
+        response.close()
+        if action == 'refresh_token':
+            headers['Authorization'] = token_provider(stale_token=headers['Authorization'])
+        elif action == 'throttled' and rate_limiter is not None:
+            # The limiter pauses this endpoint family, so the next acquire() does the waiting
+            rate_limiter.on_throttled(method, url, delay)
+        else:
+            time.sleep(delay)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
@@ -1,7 +1,12 @@
-import requests  
 import time  
 import datetime  
 import inspect
+import threading
+import asyncio
+import statistics
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor, Future
 from prefect.blocks.system import Secret  
 import json
 try:
@@ -15,6 +20,30 @@ try:
     from .bi_email import send_email
 except:
     from bi_email import send_email
+try:
+    from . import bi_http
+except:
+    import bi_http
+try:
+    from .bi_pbi_export import export_files, run_exports, ExportJob
+except:
+    from bi_pbi_export import export_files, run_exports, ExportJob
+try:
+    from .bi_pbi_governor import get_governor
+except:
+    from bi_pbi_governor import get_governor
+try:
+    from .bi_pbi_metrics import get_run_metrics, bind_run_metrics, publishes_run_metrics
+except:
+    from bi_pbi_metrics import get_run_metrics, bind_run_metrics, publishes_run_metrics
+try:
+    from .bi_pbi_scheduler import RefreshPlan, summarize_plan_results
+except:
+    from bi_pbi_scheduler import RefreshPlan, summarize_plan_results
+try:
+    from .bi_pbi_cache import PowerBiMetadataCache, get_metadata_cache, get_export_cache
+except:
+    from bi_pbi_cache import PowerBiMetadataCache, get_metadata_cache, get_export_cache
 import base64
 from prefect.variables import Variable
 
@@ -33,206 +62,616 @@ def find_reports_yaml_path():
             return Path(module_file).parent / 'reports.yaml'
     raise FileNotFoundError("Cannot determine the caller's path for reports.yaml")
 
+PBI_API_URL = "https://api.powerbi.com/v1.0/myorg"
+PBI_TOKEN_URL = "https://login.microsoftonline.com/common/oauth2/token"
+PBI_RESOURCE = "https://analysis.windows.net/powerbi/api"
+PBI_SECRET_BLOCKS = ("pbi-api-uid", "pbi-api-pwd", "pbi-api-cid", "pbi-api-cse")
+
+
+class PowerBiTokenManager:
+    """
+    Caches the Power BI bearer token for one set of credentials.
+
+    The four Secret blocks are loaded once, the token is renewed `refresh_margin` seconds
+    before it expires, and a lock makes sure only one thread is talking to the OAuth endpoint
+    at a time; every other caller waits and then reuses the token it fetched.
+    """
+    def __init__(self, secret_blocks: tuple = PBI_SECRET_BLOCKS, refresh_margin: int = 300):
+        self.secret_blocks = tuple(secret_blocks)
+        self.refresh_margin = refresh_margin
+        self._credentials = None
+        self._api_token = None
+        self._start_time = None
+        self._expires_in = 0
+        self._lock = threading.Lock()
+
+    def _load_credentials(self):
+        if self._credentials is None:
+            self._credentials = tuple(Secret.load(block_name).get() for block_name in self.secret_blocks)
+        return self._credentials
+
+    def _fetch_token(self):
+        pbi_api_uid, pbi_api_pwd, pbi_api_cid, pbi_api_cse = self._load_credentials()
+        payload = {
+            "username": pbi_api_uid,
+            "password": pbi_api_pwd,
+            "client_id": pbi_api_cid,
+            "client_secret": pbi_api_cse,
+            "resource": PBI_RESOURCE,
+            "grant_type": "password",
+        }
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        with get_run_metrics().phase('token'):
+            response = bi_http.post(PBI_TOKEN_URL, headers=headers, data=payload, metrics=get_run_metrics(), retry_non_idempotent=True)
+        if response.status_code != 200:
+            print('Error: \n' + response.text)
+            raise RuntimeError(f"Unable to get a Power BI access token, received status code: {response.status_code}")
+        api_token = "Bearer " + response.json()["access_token"]
+        expires_in = int(response.json()['expires_in'])  # convert 'expires_in' to integer
+        return api_token, datetime.datetime.now(), expires_in
+
+    def _is_valid(self, stale_token: str = None) -> bool:
+        if self._api_token is None or self._api_token == stale_token:
+            return False
+        elapsed_time = datetime.datetime.now() - self._start_time
+        return elapsed_time.total_seconds() < self._expires_in - self.refresh_margin
+
+    def get_token(self, stale_token: str = None):
+        """
+        Returns (api_token, start_time, expires_in), fetching a new token only when needed.
+
+        Pass the token that was just rejected with a 401 as `stale_token` to force a renewal;
+        if another thread already replaced it, the newer token is returned without a second fetch.
+        """
+        if self._is_valid(stale_token):
+            return self._api_token, self._start_time, self._expires_in
+        with self._lock:
+            if not self._is_valid(stale_token):
+                self._api_token, self._start_time, self._expires_in = self._fetch_token()
+            return self._api_token, self._start_time, self._expires_in
+
+    def bearer(self, stale_token: str = None) -> str:
+        """Authorization header value; used as the bi_http token provider."""
+        return self.get_token(stale_token)[0]
+
+    async def get_token_async(self, stale_token: str = None):
+        return await asyncio.to_thread(self.get_token, stale_token)
+
+
+_token_managers = {}
+_token_managers_lock = threading.Lock()
+
+
+def get_token_manager(secret_blocks: tuple = PBI_SECRET_BLOCKS) -> PowerBiTokenManager:
+    """Returns the process-wide token manager for the given credential blocks."""
+    key = tuple(secret_blocks)
+    with _token_managers_lock:
+        if key not in _token_managers:
+            _token_managers[key] = PowerBiTokenManager(key)
+        return _token_managers[key]
+
+
+class RefreshRequest:
+    """
+    Builds the body of an enhanced refresh (POST .../refreshes).
+
+    Args:
+        type: Full, ClearValues, Calculate, DataOnly, Automatic or Defragment.
+        commit_mode: 'transactional' (all or nothing) or 'partialBatch' (commit as objects finish).
+        max_parallelism: Maximum number of objects processed in parallel.
+        retry_count: How many times the service retries the refresh before failing.
+        objects: Tables/partitions to refresh, as table names or {"table": ..., "partition": ...}.
+            Empty means the whole model.
+        apply_refresh_policy: Apply the incremental refresh policy of the tables being refreshed.
+        effective_date: Date (YYYY-MM-DD) the incremental refresh policy windows are computed from.
+        timeout: Service-side timeout per attempt, e.g. '02:00:00'.
+
+    Usage:
+        request = RefreshRequest(commit_mode="partialBatch", max_parallelism=10)
+        request.add_partition("Sales", "2024Q4")
+        PowerBiRefresh("Sales Dashboard", "Finance", refresh_request=request).pbi_refresh()
+    """
+    REFRESH_TYPES = ('Full', 'ClearValues', 'Calculate', 'DataOnly', 'Automatic', 'Defragment')
+    COMMIT_MODES = ('transactional', 'partialBatch')
+
+    def __init__(self, type: str = "Full", commit_mode: str = "transactional", max_parallelism: int = None, retry_count: int = None, objects: list = None, apply_refresh_policy: bool = False, effective_date: str = None, timeout: str = None):
+        if type not in self.REFRESH_TYPES:
+            raise ValueError(f"Refresh type must be one of {self.REFRESH_TYPES}, got {type!r}")
+        if commit_mode not in self.COMMIT_MODES:
+            raise ValueError(f"Commit mode must be one of {self.COMMIT_MODES}, got {commit_mode!r}")
+        self.type = type
+        self.commit_mode = commit_mode
+        self.max_parallelism = max_parallelism
+        self.retry_count = retry_count
+        self.apply_refresh_policy = apply_refresh_policy
+        self.effective_date = effective_date
+        self.timeout = timeout
+        self.objects = []
+        for refresh_object in objects or []:
+            if isinstance(refresh_object, str):
+                self.add_table(refresh_object)
+            else:
+                self.add_partition(refresh_object['table'], refresh_object.get('partition'))
+
+    @classmethod
+    def from_options(cls, options: dict):
+        """Builds a request from a reports.yaml `refresh_options` mapping (API field names)."""
+        return cls(
+            type=options.get('type', 'Full'),
+            commit_mode=options.get('commitMode', 'transactional'),
+            max_parallelism=options.get('maxParallelism'),
+            retry_count=options.get('retryCount'),
+            objects=options.get('objects') or options.get('tables'),
+            apply_refresh_policy=options.get('applyRefreshPolicy', False),
+            effective_date=options.get('effectiveDate'),
+            timeout=options.get('timeout')
+        )
+
+    def add_table(self, table: str):
+        self.objects.append({"table": table})
+        return self
+
+    def add_partition(self, table: str, partition: str = None):
+        self.objects.append({"table": table, "partition": partition} if partition else {"table": table})
+        return self
+
+    def to_body(self, tables: list = None) -> dict:
+        """Request body; `tables` fills in the objects when none were set on the request."""
+        body = {
+            "type": self.type,
+            "commitMode": self.commit_mode,
+            "applyRefreshPolicy": self.apply_refresh_policy
+        }
+        objects = self.objects or [{"table": table} for table in tables or []]
+        if objects:
+            body["objects"] = objects
+        if self.max_parallelism is not None:
+            body["maxParallelism"] = self.max_parallelism
+        if self.retry_count is not None:
+            body["retryCount"] = self.retry_count
+        if self.effective_date is not None:
+            body["effectiveDate"] = self.effective_date
+        if self.timeout is not None:
+            body["timeout"] = self.timeout
+        return body
+
+
+def build_refresh_body(tables: list = None, refresh_request: RefreshRequest = None):
+    """Request body for POST .../refreshes; None refreshes the whole dataset."""
+    if refresh_request is not None:
+        return refresh_request.to_body(tables)
+    if tables and isinstance(tables, list) and len(tables) > 0:
+        return RefreshRequest(objects=tables).to_body()
+    return None
+
+
+def build_export_body(format_type: str, page_names: list, report_filter: str = None, parameter_values: dict = None) -> dict:
+    """
+    Request body for POST .../ExportTo, following the PowerBIReportExportConfiguration schema.
+
+    `report_filter` is an OData filter applied to the whole report, e.g. "Store/Territory eq 'NC'".
+    `parameter_values` ({name: value}) makes it a paginated report export instead, in which case
+    pages and filters don't apply.
+    """
+    if parameter_values is not None:
+        return {
+            "format": format_type,
+            "paginatedReportConfiguration": {
+                "parameterValues": [{"name": name, "value": str(value)} for name, value in parameter_values.items()]
+            }
+        }
+    body = {
+        "format": format_type,
+        "powerBIReportConfiguration": {
+            "pages": [{"pageName": page_name} for page_name in page_names]
+        }
+    }
+    if report_filter:
+        body["powerBIReportConfiguration"]["reportLevelFilters"] = [{"filter": report_filter}]
+    # Add PDF-specific settings if exporting as PDF
+    if format_type == "PDF":
+        body["powerBIReportConfiguration"].update({
+            "settings": {
+                "orientation": "Landscape"
+            }
+        })
+    return body
+
+
+EXPORT_CONTENT_TYPES = {
+    "PDF": "application/pdf",
+    "PNG": "image/png",
+    "PPTX": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+}
+REFRESH_TERMINAL_STATUSES = ('Completed', 'Failed', 'Disabled', 'Cancelled')
+
+
+def parse_pbi_time(value: str):
+    """Parses the ISO-8601 UTC timestamps returned by the REST API (e.g. '2024-05-01T09:25:43.153Z')."""
+    if not value:
+        return None
+    return datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def estimate_refresh_duration(history: list):
+    """
+    Returns (median, p90) duration in seconds of the completed refreshes in `history`
+    (the 'value' list of GET .../refreshes), or (None, None) when there is nothing to go on.
+    """
+    durations = sorted(
+        (parse_pbi_time(refresh['endTime']) - parse_pbi_time(refresh['startTime'])).total_seconds()
+        for refresh in history
+        if refresh.get('status') == 'Completed' and refresh.get('startTime') and refresh.get('endTime')
+    )
+    if not durations:
+        return None, None
+    p90_index = min(len(durations) - 1, int(round(0.9 * (len(durations) - 1))))
+    return statistics.median(durations), durations[p90_index]
+
+
+def refresh_status_from_history(history: list, triggered_at: datetime.datetime = None):
+    """
+    Status of the newest refresh in `history`, or 'NotStarted' when that entry began before
+    `triggered_at` (the refresh we just requested hasn't been registered yet). Pass
+    triggered_at only when the refresh POST was accepted (202); otherwise the newest entry,
+    e.g. a refresh that was already in progress, is followed.
+    """
+    if not history:
+        return None
+    latest = history[0]
+    started = parse_pbi_time(latest.get('startTime'))
+    # Allow a minute of clock skew between this machine and the service
+    if triggered_at is not None and started is not None and started < triggered_at - datetime.timedelta(seconds=60):
+        return 'NotStarted'
+    return latest['status']
+
+
+class AdaptivePollSchedule:
+    """
+    Decides how long to wait between refresh status checks.
+
+    With a duration estimate the first check happens shortly before the median run time, then
+    the interval halves on every check until the p90 run time is reached (the refresh is most
+    likely to finish in that window) and grows again afterwards, so overruns don't hammer the API.
+    Without an estimate it polls every `min_interval` seconds, growing towards `max_interval`.
+    """
+    def __init__(self, expected_seconds: float = None, p90_seconds: float = None, min_interval: float = 10, max_interval: float = 60):
+        self.expected_seconds = expected_seconds
+        self.p90_seconds = p90_seconds if p90_seconds is not None else expected_seconds
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = None
+
+    def first_delay(self, elapsed: float = 0) -> float:
+        """Seconds to wait before the first check, given how long the refresh has already run."""
+        if self.expected_seconds is None:
+            return self.min_interval
+        return max(self.min_interval, 0.9 * self.expected_seconds - elapsed)
+
+    def next_delay(self, elapsed: float) -> float:
+        """Seconds to wait after an unfinished check, `elapsed` seconds into the refresh."""
+        if self.interval is None:
+            if self.expected_seconds is None:
+                self.interval = self.min_interval
+            else:
+                spread = max(self.p90_seconds - self.expected_seconds, 0)
+                self.interval = min(self.max_interval, max(self.min_interval, spread / 2))
+            return self.interval
+        if self.p90_seconds is not None and elapsed < self.p90_seconds:
+            self.interval = max(self.min_interval, self.interval / 2)
+        else:
+            self.interval = min(self.max_interval, self.interval * 1.5)
+        return self.interval
+
+
+_UNRESOLVED = object()  # Memo marker for lookups that haven't run yet (None is a valid "not found" result)
+
+
 class PowerBiRefresh:    
-    def __init__(self, report_name: str, group_name: str, number_of_tries: int = 5, tables: list = None, use_app_link: bool = False, app_id: str = None):    
+    """
+    Refreshes and exports one report. The token, group, dataset, report and page lookups run on
+    first use and are memoized. The dataset id comes from the report's binding whenever the
+    report exists, so a refresh-only run lists the workspace's reports (once, cached) but never
+    its pages, and lists datasets only when no report of that name exists. Call prefetch() to
+    resolve everything up front.
+    """
+    def __init__(self, report_name: str, group_name: str, number_of_tries: int = 5, tables: list = None, use_app_link: bool = False, app_id: str = None, token_manager: PowerBiTokenManager = None, metadata_cache: PowerBiMetadataCache = None, refresh_request: RefreshRequest = None):    
         self.report_name = report_name    
         self.group_name = group_name
         self.number_of_tries = number_of_tries
         self.tables = tables  # Initialize the tables instance variable
+        self.refresh_request = refresh_request  # Enhanced refresh options (type, partitions, parallelism...)
         self.use_app_link = use_app_link  # Whether to use app link instead of direct report link
         self.app_id = app_id  # App ID for creating the app link
-        self.api_token, self.start_time, self.expires_in = self.get_power_bi_access_token()  
-        self.group_id = self.get_group_id()
-        self.dataset_id = self.get_dataset_id()
-        self.report_id,self.report_url = self.get_report_id()
-
-
-    def get_power_bi_access_token(self):      
-        pbi_api_uid_block = Secret.load("pbi-api-uid")    
-        pbi_api_pwd_block = Secret.load("pbi-api-pwd")    
-        pbi_api_cid_block = Secret.load("pbi-api-cid")    
-        pbi_api_cse_block = Secret.load("pbi-api-cse")    
-        pbi_api_uid = pbi_api_uid_block.get()    
-        pbi_api_pwd = pbi_api_pwd_block.get()    
-        pbi_api_cid = pbi_api_cid_block.get()    
-        pbi_api_cse = pbi_api_cse_block.get()    
-        increment = 0       
-        while increment <= 5:      
-            try:      
-                url = "https://login.microsoftonline.com/common/oauth2/token"      
-                payload = {      
-                    "username": pbi_api_uid,      
-                    "password": pbi_api_pwd,      
-                    "client_id": pbi_api_cid,      
-                    "client_secret": pbi_api_cse,      
-                    "resource": "https://analysis.windows.net/powerbi/api",      
-                    "grant_type": "password",      
-                }      
-                headers = {"Content-Type": "application/x-www-form-urlencoded"}      
-                response = requests.request("POST", url, headers=headers, data=payload)      
-                api_token = "Bearer " + response.json()["access_token"]        
-                expires_in = int(response.json()['expires_in'])  # convert 'expires_in' to integer  
-                break      
-            except Exception as e:      
-                print('Error: \n' + str(e))      
-                time.sleep(60)      
-                increment = increment + 1      
-        return api_token, datetime.datetime.now(), expires_in  
+        self.refresh_triggered_at = None  # UTC time of the last accepted refresh POST, used to ignore older history entries
+        self.refresh_request_id = None  # Id of the last enhanced refresh, when the service returned one
+        self._last_refresh = None  # Memoized by get_last_refresh, reset when a refresh is triggered
+        self.token_manager = token_manager or get_token_manager()
+        self.metadata_cache = metadata_cache or get_metadata_cache()
+        self.api_token, self.start_time, self.expires_in = None, None, None  # Set by check_token_refresh before every call
+        self._group_id = _UNRESOLVED
+        self._dataset_id = _UNRESOLVED
+        self._report = _UNRESOLVED
+        self._report_pages = _UNRESOLVED
+        self._listed = set()  # Workspace listings this instance fetched itself, so a missing name isn't listed twice
+
+    @property
+    def group_id(self):
+        if self._group_id is _UNRESOLVED:
+            with get_run_metrics().phase('metadata', lookup='group', report=self.report_name):
+                self._group_id = self.get_group_id()
+        return self._group_id
+
+    @group_id.setter
+    def group_id(self, value):
+        self._group_id = value
+
+    @property
+    def dataset_id(self):
+        if self._dataset_id is _UNRESOLVED:
+            with get_run_metrics().phase('metadata', lookup='dataset', report=self.report_name):
+                self._dataset_id = self.get_dataset_id()
+        return self._dataset_id
+
+    @dataset_id.setter
+    def dataset_id(self, value):
+        self._dataset_id = value
+
+    def _resolve_report(self):
+        if self._report is _UNRESOLVED:
+            with get_run_metrics().phase('metadata', lookup='report', report=self.report_name):
+                self._report = self.get_report_id() or (None, None)
+        return self._report
+
+    @property
+    def report_id(self):
+        return self._resolve_report()[0]
+
+    @property
+    def report_url(self):
+        return self._resolve_report()[1]
+
+    @property
+    def report_pages(self):
+        if self._report_pages is _UNRESOLVED:
+            with get_run_metrics().phase('metadata', lookup='pages', report=self.report_name):
+                pages = self.get_report_pages(self.report_id) if self.report_id else None
+            if pages is not None:
+                print('Report Pages: ', [page['displayName'] for page in pages])
+            self._report_pages = pages or []
+        return self._report_pages
+
+    def prefetch(self, dataset: bool = True, report: bool = True):
+        """Resolves the token and ids now (e.g. to warm many instances before a batch) and returns self."""
+        self.check_token_refresh()
+        if self.group_id is None:
+            return self
+        if report:
+            self.report_pages
+        if dataset:
+            self.dataset_id
+        return self
+
+
+    def get_power_bi_access_token(self, stale_token: str = None):
+        return self.token_manager.get_token(stale_token)
   
     def check_token_refresh(self):  
-        elapsed_time = datetime.datetime.now() - self.start_time  
-        if elapsed_time.seconds > self.expires_in - 60:  # refresh 60 seconds before token gets expired  
-            self.api_token, self.start_time, self.expires_in = self.get_power_bi_access_token()  
+        # The token manager renews ahead of expiry, so this is a cache lookup in the common case
+        self.api_token, self.start_time, self.expires_in = self.get_power_bi_access_token()  
   
+    def _request(self, method: str, url: str, **kwargs):
+        self.check_token_refresh()
+        return bi_http.request(method, url, token_provider=self.token_manager.bearer, rate_limiter=get_governor(), metrics=get_run_metrics(), **kwargs)
+
+    def _api_get(self, url: str, **kwargs):
+        return self._request("GET", url, **kwargs)
+
     def get_group_id(self):  
-        self.check_token_refresh() 
-        api_token, datetime, expires_in = self.get_power_bi_access_token()  
-        url = "https://api.powerbi.com/v1.0/myorg/groups"    
-        headers = {"Authorization": api_token} 
-        response = requests.get(url, headers=headers)    
-        if response.status_code == 401:  
-            self.api_token, _, _ = self.get_power_bi_access_token()  
-            headers = {"Authorization": self.api_token}    
-            response = requests.get(url, headers=headers)    
-        groups = response.json()['value']    
+        cache_key = f"group:{self.group_name.lower()}"
+        group_id = self.metadata_cache.get(cache_key)
+        if group_id is not None:
+            return group_id
+        # Ask the service for the one workspace we need before falling back to listing them all
+        group_filter = self.group_name.replace("'", "''")
+        response = self._api_get(f"{PBI_API_URL}/groups", params={"$filter": f"name eq '{group_filter}'"})
+        groups = response.json()['value'] if response.status_code == 200 else []
+        if not groups:
+            response = self._api_get(f"{PBI_API_URL}/groups")
+            groups = response.json()['value']
+        cached_groups = {f"group:{group['name'].lower()}": group['id'] for group in groups}
+        cached_groups.update({f"capacity:{group['id']}": group['capacityId'] for group in groups if group.get('capacityId')})
+        self.metadata_cache.set_many(cached_groups)
         for group in groups:
             if group['name'].lower() == self.group_name.lower():    
                 return group['id']
         return None
 
-    def get_dataset_id(self):  
-        self.check_token_refresh()  
-        url = f"https://api.powerbi.com/v1.0/myorg/groups/{self.group_id}/datasets"    
-        headers = {"Authorization": self.api_token}    
-        response = requests.get(url, headers=headers)    
+    def get_workspace_datasets(self, name: str = None):
+        """
+        Returns the cached {dataset name: id} of this workspace, listing them when the cache is cold.
+        When `name` is given and missing from the cached listing, it is listed again (the dataset
+        may have been published after the listing was cached).
+        """
+        cache_key = f"datasets:{self.group_id}"
+        datasets = self.metadata_cache.get(cache_key)
+        if datasets is not None and (name is None or name in datasets or cache_key in self._listed):
+            return datasets
+
+        response = self._api_get(f"{PBI_API_URL}/groups/{self.group_id}/datasets")
         print(f"Dataset request response: {response.status_code}")
-        
-        if response.status_code == 401:  
-            print("Token expired, refreshing...")
-            self.api_token, _, _ = self.get_power_bi_access_token()  
-            headers = {"Authorization": self.api_token}    
-            response = requests.get(url, headers=headers)    
-            print(f"Dataset request response after token refresh: {response.status_code}")
-        
         if response.status_code != 200:
             print(f"Error getting datasets: {response.status_code}")
             print(f"Response content: {response.text}")
             return None
-        
         try:
-            datasets = response.json()['value']    
-            for dataset in datasets:    
-                if dataset['name'] == self.report_name:   
-                    return dataset['id']   
+            datasets = {dataset['name']: dataset['id'] for dataset in response.json()['value']}
         except Exception as e:
             print(f'Error parsing dataset response: {str(e)}')
             print(f'Response content: {response.text}')
-        
-        print(f'Dataset not found or not configured to be refreshed for {self.report_name}') 
-        return None    
+            return None
+        self.metadata_cache.set(cache_key, datasets)
+        self._listed.add(cache_key)
+        return datasets
+
+    def get_workspace_reports(self, name: str = None):
+        """
+        Returns the cached {report name: {'id', 'webUrl', 'datasetId'}} of this workspace, listing
+        them when the cache is cold, or again when `name` is given and missing from the cached listing.
+        """
+        cache_key = f"reports:{self.group_id}"
+        reports = self.metadata_cache.get(cache_key)
+        if reports is not None and (name is None or name in reports or cache_key in self._listed):
+            return reports
+
+        response = self._api_get(f"{PBI_API_URL}/groups/{self.group_id}/reports")
+        print(f"get report id returned... {response}")
+        if response.status_code != 200:
+            print(f"Error: Received status code {response.status_code} from server.")
+            return None
+        try:
+            reports = {
+                report['name']: {
+                    'id': report['id'],
+                    'webUrl': report.get('webUrl'),
+                    'datasetId': report.get('datasetId')
+                } for report in response.json()['value']
+            }
+        except json.decoder.JSONDecodeError:
+            print("Failed to decode server response.")
+            return None
+        self.metadata_cache.set(cache_key, reports)
+        self._listed.add(cache_key)
+        return reports
+
+    def get_workspace_metadata(self):
+        """Returns both the datasets and the reports of this workspace, or None if either lookup failed."""
+        datasets = self.get_workspace_datasets()
+        reports = self.get_workspace_reports()
+        if datasets is None or reports is None:
+            return None
+        return {'datasets': datasets, 'reports': reports}
+
+    def get_report_pages(self, report_id: str):
+        cache_key = f"pages:{report_id}"
+        pages = self.metadata_cache.get(cache_key)
+        if pages is not None:
+            return pages
+        pages_response = self._api_get(f"{PBI_API_URL}/groups/{self.group_id}/reports/{report_id}/pages")
+        if pages_response.status_code != 200:
+            return None
+        # Store both display name and actual name
+        pages = [{
+            'displayName': page['displayName'],
+            'name': page['name']
+        } for page in pages_response.json()['value']]
+        self.metadata_cache.set(cache_key, pages)
+        return pages
+
+    def invalidate_metadata(self):
+        """Forgets the cached ids for this workspace, e.g. after a report was republished."""
+        self.metadata_cache.invalidate(f"group:{self.group_name.lower()}")
+        if self._group_id not in (_UNRESOLVED, None):
+            self.metadata_cache.invalidate(f"datasets:{self._group_id}")
+            self.metadata_cache.invalidate(f"reports:{self._group_id}")
+        self._group_id = self._dataset_id = self._report = self._report_pages = _UNRESOLVED
+        self._listed = set()
+
+    def get_dataset_id(self):  
+        dataset_id = self._find_dataset_id()
+        if dataset_id is None:
+            # Not in the cached listings; the report or dataset may be newer than the cache
+            dataset_id = self._find_dataset_id(refetch=True)
+        if dataset_id is None:
+            print(f'Dataset not found or not configured to be refreshed for {self.report_name}') 
+        return dataset_id
   
     def refresh_power_bi_dataset(self):    
-        self.check_token_refresh()  
-        url = f"https://api.powerbi.com/v1.0/myorg/groups/{self.group_id}/datasets/{self.dataset_id}/refreshes"    
-        headers = {
-            "Authorization": self.api_token, 
-            "Content-Type": "application/json"
-        }    
-        i = 0    
-        while i < 5:  
-            try:  
-                # If self.tables parameter is provided, include it in the request body
-                if self.tables and isinstance(self.tables, list) and len(self.tables) > 0:
-                    body = {
-                        "type": "Full",
-                        "commitMode": "transactional",
-                        "objects": [{"table": table} for table in self.tables],
-                        "applyRefreshPolicy": "false"
-                        }
-                    response = requests.post(url, headers=headers, json=body)
-                    print(f"Refreshing specific tables: {self.tables}")
-                    print(f"Request body: {json.dumps(body, indent=2)}")
-                else:
-                    # Default behavior: refresh all tables
-                    response = requests.post(url, headers=headers)
-                
-                if response.status_code == 401:  
-                    self.api_token, _, _ = self.get_power_bi_access_token()  
-                    headers["Authorization"] = self.api_token
-                    
-                    # Retry with new token
-                    if self.tables and isinstance(self.tables, list) and len(self.tables) > 0:
-                        body = {
-                            "type": "Full",
-                            "commitMode": "transactional",
-                            "objects": [{"table": table} for table in self.tables],
-                            "applyRefreshPolicy": "false"
-                            }
-                        response = requests.post(url, headers=headers, json=body)
-                    else:
-                        response = requests.post(url, headers=headers)
-                
-                time.sleep(10)  
-                return response  
-            except Exception as e:  
-                print('Power BI API refresh error on attempt ' + str(i) + ' /n' + "Error Description: " + str(e))  
-                i = i + 1  
-                time.sleep(10)  
+        url = f"{PBI_API_URL}/groups/{self.group_id}/datasets/{self.dataset_id}/refreshes"    
+        headers = {"Content-Type": "application/json"}    
+        # If self.tables or self.refresh_request is provided, send an enhanced refresh body
+        body = build_refresh_body(self.tables, self.refresh_request)
+        self.refresh_triggered_at = datetime.datetime.now(datetime.timezone.utc)
+        self._last_refresh = None
+        if body is not None:
+            print(f"Refreshing objects: {body.get('objects', 'all')}")
+            print(f"Request body: {json.dumps(body, indent=2)}")
+            response = self._request("POST", url, headers=headers, json=body)
+        else:
+            # Default behavior: refresh all tables
+            response = self._request("POST", url, headers=headers)
+        # Enhanced refreshes (requests with a body) return their id at the end of the Location header
+        location = response.headers.get('Location')
+        self.refresh_request_id = location.rstrip('/').split('/')[-1] if location else None
+        if response.status_code != 202:
+            # Nothing new was queued (e.g. 400, a refresh is already in progress): follow the newest history entry
+            self.refresh_triggered_at = None
+        return response  
   
+    def cancel_refresh(self, request_id: str = None):
+        """Cancels an in-flight enhanced refresh (defaults to the one this instance last triggered)."""
+        request_id = request_id or self.refresh_request_id
+        if request_id is None:
+            raise ValueError("Only enhanced refreshes (started with tables or a RefreshRequest) can be cancelled")
+        url = f"{PBI_API_URL}/groups/{self.group_id}/datasets/{self.dataset_id}/refreshes/{request_id}"
+        response = self._request("DELETE", url)
+        print(f"Cancel refresh response: {response.status_code}")
+        if response.status_code not in [200, 202]:
+            raise ValueError(f"Failed to cancel refresh {request_id}, received status code: {response.status_code}")
+        return response
+
     def get_dataset_source(self):    
-        self.check_token_refresh()  
-        url = f"https://api.powerbi.com/v1.0/myorg/groups/{self.group_id}/datasets/{self.dataset_id}/datasources"   
-        headers = {"Authorization": self.api_token}    
-        i = 0    
-        while i < 5:  
-            try:  
-                response = requests.post(url, headers=headers)  
-                if response.status_code == 401:  
-                    self.api_token, _, _ = self.get_power_bi_access_token()  
-                    headers = {"Authorization": self.api_token}    
-                    response = requests.post(url, headers=headers)  
-                time.sleep(10)  
-                return response  
-            except Exception as e:  
-                print('Power BI API get dataset source error on attempt ' + str(i) + ' /n' + "Error Description: " + str(e))  
-                i = i + 1  
-                time.sleep(10)  
+        url = f"{PBI_API_URL}/groups/{self.group_id}/datasets/{self.dataset_id}/datasources"   
+        return self._request("POST", url)
 
-    def power_bi_dataset_refresh_status(self):  
-        self.check_token_refresh()
-        url = f"https://api.powerbi.com/v1.0/myorg/groups/{self.group_id}/datasets/{self.dataset_id}/refreshes?$top=1"  
-        headers = {"Authorization": self.api_token}  
-        response_status = requests.get(url, headers=headers)  
-        if response_status.status_code == 401:  
+    def get_refresh_history(self, top: int = 10):
+        """Most recent refreshes of the dataset, newest first, or None if the call failed."""
+        url = f"{PBI_API_URL}/groups/{self.group_id}/datasets/{self.dataset_id}/refreshes?$top={top}"  
+        response = self._api_get(url)  
+        if response.status_code != 200:  
             return None
-        json_data = response_status.json()
-        return json_data['value'][0]['status']
+        return response.json()['value']
 
-    def power_bi_check_refresh_status(self):
-        self.check_token_refresh()
-        i = 0
-        while i < self.number_of_tries:
-            status = self.power_bi_dataset_refresh_status()
-            if status is None:
-                self.api_token, _, _ = self.get_power_bi_access_token()
-                status = self.power_bi_dataset_refresh_status()
-            if status == 'Completed':
-                print('Status Check: Completed')
-                if self.report_id is not None:
-                    print('Report ID: ', self.report_id)
-                else:
-                    print('No report found for the dataset.')
-                return status
-            else:
-                print(f"""
+    def power_bi_dataset_refresh_status(self):  
+        return refresh_status_from_history(self.get_refresh_history(top=1), self.refresh_triggered_at)
+
+    def power_bi_check_refresh_status(self, timeout_seconds: int = None, history_size: int = 10):
+        """
+        Waits for the current refresh to reach a terminal status and returns that status.
+
+        Past refreshes of the dataset are used to predict how long this one will take (see
+        AdaptivePollSchedule). `timeout_seconds` is wall-clock time and defaults to
+        number_of_tries minutes, which is what the old one-check-per-minute loop allowed.
+        """
+        if timeout_seconds is None:
+            timeout_seconds = self.number_of_tries * 60
+        deadline = time.monotonic() + timeout_seconds
+
+        history = self.get_refresh_history(top=history_size) or []
+        status = refresh_status_from_history(history, self.refresh_triggered_at)
+        expected_seconds, p90_seconds = estimate_refresh_duration(history)
+        schedule = AdaptivePollSchedule(expected_seconds, p90_seconds)
+        started = parse_pbi_time(history[0].get('startTime')) if history and status != 'NotStarted' else None
+        elapsed = (datetime.datetime.now(datetime.timezone.utc) - started).total_seconds() if started else 0
+        if expected_seconds is not None:
+            print(f"Expected refresh duration: {expected_seconds:.0f}s (p90 {p90_seconds:.0f}s)")
+
+        delay = schedule.first_delay(elapsed)
+        while status not in REFRESH_TERMINAL_STATUSES:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            print(f"""
                             Status Check:
-                      Not completed, checking again in {1} minute
+                      Not completed, checking again in {min(delay, remaining):.0f} seconds
                       """)
-                time.sleep(60)
-                i = i + 1
-        elapsed_time = datetime.datetime.now() - self.start_time
-        if elapsed_time.seconds > 3600:
-            self.api_token, _, _ = self.get_power_bi_access_token()
+            time.sleep(min(delay, remaining))
+            status = self.power_bi_dataset_refresh_status()
+            elapsed = (datetime.datetime.now(datetime.timezone.utc) - self.refresh_triggered_at).total_seconds() if self.refresh_triggered_at else elapsed + delay
+            delay = schedule.next_delay(elapsed)
+
+        if status == 'Completed':
+            print('Status Check: Completed')
         return status
 
 
@@ -248,85 +687,74 @@ class PowerBiRefresh:
             print("Refresh Response: Failed, received status code: ", refresh_response.status_code)    
     
         # Check refresh status      
-        status_check_response = self.power_bi_check_refresh_status()      
+        with get_run_metrics().phase('refresh_wait', report=self.report_name):
+            status_check_response = self.power_bi_check_refresh_status()      
         print("Status Check Response: ", status_check_response)    
     
         return refresh_response, status_check_response  
     
 
 
+    def _find_dataset_id(self, refetch: bool = False):
+        # The dataset the report is bound to wins (thin reports are named differently from their
+        # dataset), so the id is the same whether the refresh or the export side resolves it first
+        name = self.report_name if refetch else None
+        report = (self.get_workspace_reports(name) or {}).get(self.report_name)
+        if report and report.get('datasetId'):
+            return report['datasetId']
+        return (self.get_workspace_datasets(name) or {}).get(self.report_name)
+
     def get_report_id(self):   
-        self.check_token_refresh() 
-        url = f"https://api.powerbi.com/v1.0/myorg/groups/{self.group_id}/reports"    
-        headers = {"Authorization": self.api_token}    
-        response = requests.get(url, headers=headers)    
-        print(f"get report id returned... {response}")
-        if response.status_code == 401:  
-            self.api_token, _, _ = self.get_power_bi_access_token()  
-            headers = {"Authorization": self.api_token}    
-            response = requests.get(url, headers=headers)    
-        if response.status_code != 200:    
-            print(f"Error: Received status code {response.status_code} from server.")  
-            return None  
-        if not response.text:  
-            print("No reports available for this dataset.")  
-            return None  
-        try:  
-            reports = response.json()['value']  
-            for report in reports:    
-                if  report['name'] == self.report_name:   
-                    self.dataset_id = report['datasetId'] 
-                    print('Report Name: ', report['name'])
-                    # Get report pages
-                    pages_url = f"https://api.powerbi.com/v1.0/myorg/groups/{self.group_id}/reports/{report['id']}/pages"
-                    pages_response = requests.get(pages_url, headers=headers)
-                    if pages_response.status_code == 200:
-                        pages = pages_response.json()['value']
-                        # Store both display name and actual name
-                        self.report_pages = [{
-                            'displayName': page['displayName'],
-                            'name': page['name']
-                        } for page in pages]
-                        print('Report Pages: ', [page['displayName'] for page in self.report_pages])
-                    return report['id'], report['webUrl']
-        except json.decoder.JSONDecodeError:  
-            print("Failed to decode server response.")  
-            return None  
-        return None  
+        reports = self.get_workspace_reports(self.report_name)
+        if reports is None:
+            return None
+        report = reports.get(self.report_name)
+        if report is None:
+            print("No reports available for this dataset.")
+            return None
+        if self._dataset_id is _UNRESOLVED or self._dataset_id is None:
+            # The report knows its dataset, so export-only runs never need to list datasets
+            self._dataset_id = report['datasetId']
+        print('Report Name: ', self.report_name)
+        return report['id'], report['webUrl']
 
-    def export_report_to_file(self):    
-        self.check_token_refresh()  
-        url = f"https://api.powerbi.com/v1.0/myorg/reports/{self.report_id}/ExportTo"    
+    def resolve_page_names(self, pages: list = None) -> list:
+        """Internal page names for the given display names (case-insensitive); the first page when none are given."""
+        if not pages:
+            return [self.report_pages[0]['name']] if self.report_pages else []
+        page_names = []
+        for page in pages:
+            matching_page = next((p for p in self.report_pages if p['displayName'].lower() == page.lower()), None)
+            if matching_page:
+                page_names.append(matching_page['name'])
+            else:
+                print(f"Warning: Page '{page}' not found in report")
+        return page_names
+
+    def _export_body(self, format_type: str, page_names: list = None, report_filter: str = None, parameter_values: dict = None) -> dict:
+        if parameter_values is None:
+            page_names = page_names or [self.report_pages[0]['name']]
+        return build_export_body(format_type, page_names, report_filter, parameter_values)
+
+    def start_export(self, format_type: str = "PNG", page_names: list = None, report_filter: str = None, parameter_values: dict = None) -> str:
+        """
+        Submits an ExportTo job for the given pages (internal page names) and returns its export id.
+        See build_export_body for `report_filter` and `parameter_values` (paginated reports).
+        """
+        url = f"{PBI_API_URL}/groups/{self.group_id}/reports/{self.report_id}/ExportTo"    
         headers = {
-            "Authorization": self.api_token, 
             "Content-Type": "application/json",
             "Accept": "application/json"
         }    
         
-        # Get pages to export
-        pages_to_export = getattr(self, 'pages_to_export', None) or [self.report_pages[0]['name']]
-        print(f"Exporting pages: {pages_to_export}")
-        
-        # Configure according to PowerBIReportExportConfiguration schema
-        body = {
-            "format": self.format_type,
-            "powerBIReportConfiguration": {
-                "pages": [{"pageName": page_name} for page_name in pages_to_export]
-            }
-        }
-
-        # Add PDF-specific settings if exporting as PDF
-        if self.format_type == "PDF":
-            body["powerBIReportConfiguration"].update({
-                "settings": {
-                    "orientation": "Landscape"
-                }
-            })
+        body = self._export_body(format_type, page_names, report_filter, parameter_values)
+        if parameter_values is None:
+            print(f"Exporting pages: {[page['pageName'] for page in body['powerBIReportConfiguration']['pages']]}")
         
         print(f"Sending export request to: {url}")
         print(f"Request body: {json.dumps(body, indent=2)}")
         
-        response = requests.post(url, headers=headers, json=body)   
+        response = self._request("POST", url, headers=headers, json=body)   
         print(f"Export request response status: {response.status_code}")
         
         if response.status_code != 202:  # Power BI uses 202 for accepted requests
@@ -334,22 +762,21 @@ class PowerBiRefresh:
             raise ValueError(f"Export request failed with status code: {response.status_code}")
         
         try:
-            self.export_id = response.json()['id']
-            print(f"Got export ID: {self.export_id}")
-            return self.export_id
+            export_id = response.json()['id']
+            print(f"Got export ID: {export_id}")
+            return export_id
         except Exception as e:
             print(f"Failed to get export ID from response: {response.text}")
             raise
 
+    def export_report_to_file(self):    
+        self.export_id = self.start_export(self.format_type, getattr(self, 'pages_to_export', None))
+        return self.export_id
   
-    def check_export_status(self):  
-        self.check_token_refresh()  
-        url = f"https://api.powerbi.com/v1.0/myorg/reports/{self.report_id}/exports/{self.export_id}"  
-        headers = {
-            "Authorization": self.api_token,
-            "Accept": "application/json"
-        }  
-        response = requests.get(url, headers=headers)  
+    def get_export_status(self, export_id: str) -> str:  
+        url = f"{PBI_API_URL}/groups/{self.group_id}/reports/{self.report_id}/exports/{export_id}"  
+        headers = {"Accept": "application/json"}  
+        response = self._api_get(url, headers=headers)  
         
         if response.status_code not in [200, 202]:  # Both 200 and 202 are valid responses
             print(f"Failed to get status. Status code: {response.status_code}, Content: {response.text}")
@@ -364,20 +791,16 @@ class PowerBiRefresh:
         print(f"Status: {status}, Progress: {percent_complete}%")
         
         return status
+
+    def check_export_status(self):  
+        return self.get_export_status(self.export_id)
   
-    def get_export_file(self):  
-        self.check_token_refresh()  
-        url = f"https://api.powerbi.com/v1.0/myorg/reports/{self.report_id}/exports/{self.export_id}/file"  
-        
-        # Set Accept header based on format type
-        content_type = "application/pdf" if self.format_type == "PDF" else "image/png"
-        headers = {
-            "Authorization": self.api_token,
-            "Accept": content_type
-        }  
+    def _export_file_response(self, export_id: str, format_type: str):
+        url = f"{PBI_API_URL}/groups/{self.group_id}/reports/{self.report_id}/exports/{export_id}/file"  
+        headers = {"Accept": EXPORT_CONTENT_TYPES.get(format_type, "application/octet-stream")}  
         
         print(f"Requesting export file from: {url}")
-        response = requests.get(url, headers=headers, stream=True)  
+        response = self._api_get(url, headers=headers, stream=True)  
         
         # Debug: Print response headers
         print(f"Response headers: {response.headers}")
@@ -385,7 +808,10 @@ class PowerBiRefresh:
         if response.status_code != 200:
             print(f"Failed to get export file. Status: {response.status_code}, Content: {response.text}")
             raise ValueError(f"Failed to get export file with status code: {response.status_code}")
-        
+        return response
+
+    def get_export_file(self):  
+        response = self._export_file_response(self.export_id, self.format_type)
         content = response.content
         if not content:
             raise ValueError("Received empty content from export file request")
@@ -395,8 +821,55 @@ class PowerBiRefresh:
         print(f"Content length: {len(content)} bytes")
         
         return content
+
+    def download_export(self, export_id: str, format_type: str, file_name: str = None, expected_sha256: str = None, chunk_size: int = 1024 * 1024) -> str:
+        """
+        Streams a finished export to `file_name` (default '<report name>.<format>') and returns the path.
+
+        The body is written in `chunk_size` pieces to a temporary file next to the target and only
+        renamed into place once it is complete, so memory stays flat and a failed download never
+        leaves a truncated file behind. The size is checked against Content-Length, and against
+        `expected_sha256` when given.
+        """
+        file_name = file_name or f"{self.report_name}.{format_type.lower()}"
+        target = Path(file_name)
+        tmp_path = target.with_name(f".{target.name}.{os.getpid()}.{threading.get_ident()}.part")
+        started = time.perf_counter()
+        response = self._export_file_response(export_id, format_type)
+        digest = hashlib.sha256()
+        file_size = 0
+        print(f"Writing content to file: {file_name}")
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if chunk:
+                        f.write(chunk)
+                        digest.update(chunk)
+                        file_size += len(chunk)
+            response.close()
+
+            if file_size == 0:
+                raise ValueError("Received empty content from export file request")
+            # Content-Length counts encoded bytes, so it can only be compared for unencoded bodies
+            content_length = response.headers.get('Content-Length')
+            if content_length is not None and not response.headers.get('Content-Encoding') and int(content_length) != file_size:
+                raise ValueError(f"Export download incomplete: expected {content_length} bytes, received {file_size}")
+            if expected_sha256 is not None and digest.hexdigest() != expected_sha256.lower():
+                raise ValueError(f"Export download checksum mismatch for {file_name}")
+
+            os.replace(tmp_path, target)
+        except Exception:
+            response.close()
+            if tmp_path.exists():
+                tmp_path.unlink()
+            raise
+
+        self.last_export_sha256 = digest.hexdigest()
+        get_run_metrics().record_phase('download', time.perf_counter() - started, num_bytes=file_size, report=self.report_name, format=format_type)
+        print(f"File saved successfully. Size: {file_size} bytes")
+        return file_name
   
-    def export_report(self, format_type="PNG"):  
+    def export_report(self, format_type="PNG", page_names: list = None, file_name: str = None):  
         self.check_token_refresh()  
         self.format_type = format_type
         
@@ -407,17 +880,17 @@ class PowerBiRefresh:
         
         try:
             # Start export  
-            self.export_id = self.export_report_to_file()
+            self.export_id = self.start_export(format_type, page_names or getattr(self, 'pages_to_export', None))
             
             # Check status  
             print("Waiting for export to complete...")
-            status = self.check_export_status()  
+            status = self.get_export_status(self.export_id)  
             attempts = 0
             max_attempts = 30  # Maximum number of attempts (5 seconds * 30 = 150 seconds timeout)
             
             while status not in ["Succeeded", "Failed"] and attempts < max_attempts:
                 time.sleep(5)  # Wait for 5 seconds  
-                status = self.check_export_status()  
+                status = self.get_export_status(self.export_id)  
                 attempts += 1
                 
             if status == "Failed":
@@ -427,34 +900,114 @@ class PowerBiRefresh:
 
             # Get file  
             print("Export succeeded, downloading file...")
-            file_content = self.get_export_file()  
-            
-            if not file_content:
-                raise ValueError("Received empty file content from Power BI")
-
-            # Save file with binary content
-            self.report_export_file_name = f"{self.report_name}.{format_type.lower()}"
-            print(f"Writing content to file: {self.report_export_file_name}")
-            
-            # Write the binary content to file
-            with open(self.report_export_file_name, "wb") as f:  
-                f.write(file_content)  
-            
-            # Verify file was written correctly
-            file_size = Path(self.report_export_file_name).stat().st_size
-            print(f"File saved successfully. Size: {file_size} bytes")
-            
-            if file_size == 0:
-                raise ValueError("File was created but is empty")
-            
+            self.report_export_file_name = self.download_export(self.export_id, format_type, file_name)
             return self.report_export_file_name
             
         except Exception as e:
             print(f"Error during report export: {str(e)}")
             raise
 
+    def get_last_refresh(self):
+        """The dataset's last successful refresh (an entry of GET .../refreshes), or None."""
+        if self._last_refresh is None:
+            history = self.get_refresh_history(top=10) or []
+            self._last_refresh = next((refresh for refresh in history if refresh.get('status') == 'Completed'), None)
+        return self._last_refresh
+
+    def get_last_refresh_time(self):
+        """End time (as returned by the API) of the dataset's last successful refresh, or None."""
+        last_refresh = self.get_last_refresh()
+        return last_refresh.get('endTime') if last_refresh else None
+
+    def export_cache_key(self, format_type: str, page_names: list = None, report_filter: str = None, parameter_values: dict = None):
+        """
+        Cache key for an export of this report, or None when the dataset has no successful
+        refresh to pin the data version to (e.g. DirectQuery models), in which case nothing is cached.
+        """
+        refresh_end = self.get_last_refresh_time()
+        if refresh_end is None or not self.report_id:
+            return None
+        body = self._export_body(format_type, page_names, report_filter, parameter_values)
+        key_source = json.dumps([self.report_id, body, refresh_end], sort_keys=True)
+        return hashlib.sha256(key_source.encode()).hexdigest()
+
+    def get_capacity_key(self) -> str:
+        """Capacity the workspace runs on (falls back to the workspace id), used to cap concurrent exports."""
+        return self.metadata_cache.get(f"capacity:{self.group_id}") or self.group_id
+
+    def _execute_dax_query(self, query: str, include_nulls: bool = True, impersonated_user_name: str = None) -> list:
+        """Runs one DAX query against the dataset and returns the rows of its result table."""
+        try:
+            from .bi_pbi_dax import build_dax_body, DAX_MAX_ROWS
+        except:
+            from bi_pbi_dax import build_dax_body, DAX_MAX_ROWS
+        url = f"{PBI_API_URL}/groups/{self.group_id}/datasets/{self.dataset_id}/executeQueries"
+        response = self._request("POST", url, json=build_dax_body(query, include_nulls, impersonated_user_name), retry_non_idempotent=True)
+        if response.status_code != 200:
+            raise ValueError(f"executeQueries failed for {self.report_name}, received status code: {response.status_code}\n{response.text}")
+        result = response.json()['results'][0]
+        if result.get('error'):
+            raise ValueError(f"DAX query failed for {self.report_name}: {result['error']}")
+        tables = result.get('tables') or []
+        rows = tables[0].get('rows', []) if tables else []
+        if len(rows) >= DAX_MAX_ROWS:
+            print(f"Warning: DAX result for {self.report_name} hit the {DAX_MAX_ROWS} row limit and may be truncated, use execute_dax_paged")
+        return rows
+
+    def execute_dax(self, queries, output: str = "arrow", max_workers: int = 4, include_nulls: bool = True, impersonated_user_name: str = None, short_column_names: bool = True):
+        """
+        Runs DAX queries against the report's dataset through the executeQueries endpoint.
+
+        Args:
+            queries: One DAX query ("EVALUATE ...") or a list of them.
+            output: "arrow" (pyarrow.Table), "pandas" (DataFrame) or "rows" (list of dicts).
+            max_workers: Queries of a list run concurrently, since the service accepts only one
+                query per request; the governor's query limit still applies.
+            include_nulls: Keep null values in the rows instead of dropping the keys.
+            impersonated_user_name: UPN to evaluate row-level security as.
+            short_column_names: Name columns "Amount" instead of "Sales[Amount]".
+
+        Returns:
+            One result for a single query, or a list of results in `queries` order.
+        """
+        try:
+            from .bi_pbi_dax import format_dax_result
+        except:
+            from bi_pbi_dax import format_dax_result
+        single = isinstance(queries, str)
+        queries = [queries] if single else list(queries)
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(queries)))) as executor:
+            row_sets = list(executor.map(bind_run_metrics(lambda query: self._execute_dax_query(query, include_nulls, impersonated_user_name)), queries))
+        results = [format_dax_result(rows, output, short_column_names) for rows in row_sets]
+        return results[0] if single else results
+
+    def execute_dax_paged(self, table_expression: str, order_by: str, page_size: int = None, output: str = "arrow", include_nulls: bool = True, impersonated_user_name: str = None, short_column_names: bool = True):
+        """
+        Reads a table expression larger than the executeQueries row limit in pages of `page_size`
+        rows (TOPNSKIP ordered by `order_by`, which should be unique) and returns them as one result.
+
+        Example:
+            power_bi.execute_dax_paged("'Sales'", "'Sales'[SalesKey]", output="pandas")
+        """
+        try:
+            from .bi_pbi_dax import format_dax_result, topnskip_query, DAX_PAGE_SIZE
+        except:
+            from bi_pbi_dax import format_dax_result, topnskip_query, DAX_PAGE_SIZE
+        page_size = page_size or DAX_PAGE_SIZE
+        rows = []
+        while True:
+            page = self._execute_dax_query(topnskip_query(table_expression, order_by, page_size, len(rows)), include_nulls, impersonated_user_name)
+            rows.extend(page)
+            if len(page) < page_size:
+                break
+        return format_dax_result(rows, output, short_column_names)
+
 
-    def pbi_refresh(self):  
+    def pbi_refresh(self, poller=None):  
+        """
+        Triggers a refresh and waits for it. Pass a RefreshPoller to have it watched by the shared
+        poller instead of this instance's own status loop.
+        """
         self.check_token_refresh()  
         # Trigger refresh  
         refresh_response = self.refresh_power_bi_dataset()  
@@ -464,8 +1017,14 @@ class PowerBiRefresh:
             print("Refresh Response: Failed, received status code: ", refresh_response.status_code)  
   
         # Check refresh status  
-        status_check_response = self.power_bi_check_refresh_status()  
+        with get_run_metrics().phase('refresh_wait', report=self.report_name) as phase:
+            if poller is not None:
+                status_check_response = poller.watch_refresh(self).result()
+            else:
+                status_check_response = self.power_bi_check_refresh_status()  
+            phase['status'] = status_check_response
         print("Status Check Response: ", status_check_response)
+        return status_check_response
 
     def get_app_url(self):
         """
@@ -481,6 +1040,212 @@ class PowerBiRefresh:
 
 ################################################################################################################################
 
+def plan_source_refresh(power_bi: PowerBiRefresh, source_tables: list, last_altered: dict, tables: list = None):
+    """
+    Decides whether a report's dataset needs refreshing based on its Snowflake sources.
+
+    Args:
+        power_bi: The report's PowerBiRefresh.
+        source_tables: The report's `source_tables` from reports.yaml. Each entry is either a
+            table name or {"table": <name>, "pbi_tables": [<dataset tables it feeds>]}.
+        last_altered: {table name: LAST_ALTERED} from bi_db.get_tables_last_altered.
+        tables: Dataset tables to refresh when the refresh can't be narrowed.
+
+    Returns:
+        (should_refresh, tables). Nothing is refreshed when no source changed after the last
+        successful refresh started. When every changed source lists its pbi_tables, only those
+        dataset tables are refreshed. A source with no LAST_ALTERED counts as changed.
+    """
+    last_refresh = power_bi.get_last_refresh()
+    if last_refresh is None or not last_refresh.get('startTime'):
+        return True, tables
+    refreshed_at = parse_pbi_time(last_refresh['startTime'])
+
+    changed = []
+    for source in source_tables:
+        table_name = source if isinstance(source, str) else source.get('table')
+        altered = last_altered.get(table_name)
+        if altered is not None and altered.tzinfo is None:
+            altered = altered.replace(tzinfo=datetime.timezone.utc)
+        if altered is None or altered >= refreshed_at:
+            changed.append(source)
+
+    if not changed:
+        return False, None
+    if all(isinstance(source, dict) and source.get('pbi_tables') for source in changed):
+        return True, sorted({pbi_table for source in changed for pbi_table in source['pbi_tables']})
+    return True, tables
+
+
+class SharedDatasetRefreshes:
+    """
+    Refreshes each dataset at most once per run.
+
+    Thin reports over a shared dataset all resolve to the same (group_id, dataset_id). The first
+    report to ask triggers and waits for the refresh; every other report on that dataset with
+    the same refresh body (tables, refresh options) waits for the same refresh (or reuses its
+    result if it already finished) instead of triggering its own, which would only be rejected
+    as already in progress and polled a second time. A report asking for a different body gets
+    its own refresh, started once the dataset's current refresh has finished, so its tables are
+    never silently skipped.
+    """
+    def __init__(self):
+        self._refreshes = {}  # (group_id, dataset_id, refresh body) -> (Future of the refresh status, report that triggered it)
+        self._dataset_locks = {}  # (group_id, dataset_id) -> Lock held while a refresh of the dataset runs
+        self._lock = threading.Lock()
+
+    def refresh(self, power_bi: PowerBiRefresh, poller=None):
+        """Returns the refresh status of power_bi's dataset, triggering the refresh only for the first caller."""
+        body = build_refresh_body(power_bi.tables, power_bi.refresh_request)
+        key = (power_bi.group_id, power_bi.dataset_id, json.dumps(body, sort_keys=True))
+        with self._lock:
+            shared = self._refreshes.get(key)
+            if shared is None:
+                self._refreshes[key] = (Future(), power_bi.report_name)
+            dataset_lock = self._dataset_locks.setdefault(key[:2], threading.Lock())
+        if shared is not None:
+            future, owner = shared
+            print(f"{power_bi.report_name} shares its dataset with {owner}, reusing that refresh")
+            return future.result()
+
+        future = self._refreshes[key][0]
+        try:
+            with dataset_lock:
+                status = power_bi.pbi_refresh(poller=poller)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        future.set_result(status)
+        return status
+
+
+def _refresh_yaml_report(
+                    report: dict,
+                    number_of_tries: int,
+                    send_email_when_done: bool,
+                    tables: list,
+                    use_app_link: bool,
+                    app_id: str,
+                    poller=None,
+                    source_last_altered: dict = None,
+                    refresh_options: dict = None,
+                    shared_refreshes: SharedDatasetRefreshes = None
+                          ) -> None:
+    report_name = report.get('name')
+    group_name = report.get('group_name')
+    refresh = report.get('Refresh', True)
+    export_options = report.get('Export', [])
+    
+    # Convert list of dictionaries into a single dictionary for easier access
+    export_options_dict = {k: v for d in export_options for k, v in d.items()}
+    
+    pdf = export_options_dict.get('PDF', False)
+    png = export_options_dict.get('PNG', False)
+    pptx = export_options_dict.get('PPTX', False)
+
+    if refresh:
+        print(f"Refreshing {report_name} in Workspace {group_name}...")
+        # Pass use_app_link and app_id to the PowerBiRefresh constructor
+        # Per-report refresh_options in the yaml take precedence over the ones passed to report_refresh
+        report_refresh_options = report.get('refresh_options') or refresh_options
+        refresh_request = RefreshRequest.from_options(report_refresh_options) if report_refresh_options else None
+        power_bi_refresh = PowerBiRefresh(report_name, group_name, number_of_tries, tables=tables, 
+                                        use_app_link=use_app_link, app_id=app_id, refresh_request=refresh_request)  
+        if source_last_altered is not None and report.get('source_tables'):
+            should_refresh, power_bi_refresh.tables = plan_source_refresh(power_bi_refresh, report['source_tables'], source_last_altered, tables)
+            if not should_refresh:
+                print(f"Skipping {report_name}: no source table changed since the last successful refresh")
+                return
+        if shared_refreshes is not None:
+            status = shared_refreshes.refresh(power_bi_refresh, poller=poller)
+        else:
+            status = power_bi_refresh.pbi_refresh(poller=poller)
+        if status != 'Completed':
+            # Failed, cancelled or timed out: no export/email, and the refresh plan skips dependents
+            raise RuntimeError(f"Refresh of {report_name} in workspace {group_name} ended with status {status}")
+
+
+        if send_email_when_done:  
+            report_id, webUrl = power_bi_refresh.report_id, power_bi_refresh.report_url
+            
+            # Use app URL if requested and available
+            if use_app_link and app_id:
+                app_url = power_bi_refresh.get_app_url()
+                if app_url:
+                    link_url = app_url
+                    link_text = "View in Power BI App"
+                else:
+                    link_url = webUrl
+                    link_text = "Link to Report"
+            else:
+                link_url = webUrl
+                link_text = "Link to Report"
+
+            html_content = f'''
+            <div style="font-family: Arial, sans-serif; border: 2px solid #4CAF50; padding: 16px; border-radius: 8px; background-color: #f9f9f9;">
+                <h2 style="color: #4CAF50;">Power BI Refresh: <span style="font-weight: bold;">{report_name} in Workspace: {group_name}</span> completed successfully.</h2>
+                <p style="font-size: 18px;">Click the button below to view the report:</p>
+                <br><a href="{link_url}" style="background-color: #4CAF50; color: white; padding: 14px 20px; margin: 8px 0; border: none; cursor: pointer; border-radius: 4px; text-decoration: none;">{link_text}</a><br>
+            </div>
+            '''
+
+            body = html_content
+            subject = f"Power BI Refresh: {report_name} in workspace {group_name} completed successfully."
+        
+            files = []
+
+            # Export all requested formats together
+            formats = [format_type for format_type, wanted in (("PPTX", pptx), ("PNG", png), ("PDF", pdf)) if wanted]
+            if formats:
+                if report_id is not None:
+                    files = export_files(power_bi_refresh, formats)
+                else:
+                    print("No report found for the dataset.")
+
+            send_email(
+                        subject=subject,
+                        body=body,
+                        attachments=files
+                        )
+
+
+def _refresh_yaml_reports_in_parallel(
+                    reports: list,
+                    max_concurrency: int,
+                    max_concurrency_per_workspace: int,
+                    **refresh_kwargs
+                          ) -> None:
+    """
+    Runs _refresh_yaml_report for every report through a RefreshPlan: reports without
+    `depends_on` start together, the others as soon as their upstream reports succeed. Each
+    report emails and exports as soon as its own refresh finishes; a semaphore per workspace
+    keeps at most `max_concurrency_per_workspace` refreshes running against the same
+    workspace/capacity. Status checks for all reports go through one shared RefreshPoller.
+    """
+    try:
+        from .bi_pbi_poller import get_refresh_poller
+    except:
+        from bi_pbi_poller import get_refresh_poller
+    refresh_kwargs['poller'] = get_refresh_poller()
+    plan = RefreshPlan.from_reports(reports)
+    workspace_semaphores = {}
+    for report in reports:
+        workspace = str(report.get('group_name')).lower()
+        workspace_semaphores.setdefault(workspace, threading.BoundedSemaphore(max_concurrency_per_workspace))
+
+    def run(report):
+        with workspace_semaphores[str(report.get('group_name')).lower()]:
+            _refresh_yaml_report(report, **refresh_kwargs)
+
+    results = plan.run(bind_run_metrics(run), max_concurrency=max_concurrency)
+    summary = summarize_plan_results(results)
+    print(f"Power BI refresh summary:\n{summary}")
+    failures = [name for name, result in results.items() if result['status'] != 'Succeeded']
+    if failures:
+        raise RuntimeError(f"Power BI refresh failed or was skipped for: {', '.join(failures)}\n{summary}")
+
+
+@publishes_run_metrics("report_refresh")
 def report_refresh(
                     number_of_tries: int = 35,
                     send_email_when_done: bool = False,
@@ -489,86 +1254,88 @@ def report_refresh(
                     reports_yaml_file_path: str = find_reports_yaml_path(),
                     tables: list = None,
                     use_app_link: bool = False,
-                    app_id: str = None
+                    app_id: str = None,
+                    parallel: bool = False,
+                    max_concurrency: int = 10,
+                    max_concurrency_per_workspace: int = 3,
+                    skip_unchanged_sources: bool = False,
+                    refresh_options: dict = None
                           ) -> None:
+    """
+    Refreshes (and optionally emails/exports) every report listed in reports.yaml.
+
+    With parallel=True all refreshes are started together instead of one after another, so the
+    run takes about as long as the slowest report. `max_concurrency` caps the total number of
+    reports in flight and `max_concurrency_per_workspace` caps them per workspace.
+
+    With skip_unchanged_sources=True, reports that list `source_tables` are only refreshed when
+    one of those Snowflake tables changed since their last successful refresh (see
+    plan_source_refresh). LAST_ALTERED for every report is read in a single query.
+
+    Reports can name other reports they depend on with `depends_on` (e.g. a composite model
+    over a shared dataset). They are then run as a dependency graph: each report starts when its
+    upstream reports have succeeded, and is skipped when one of them failed. Without
+    parallel=True the graph is walked one report at a time in dependency order. A report listed
+    in several workspaces is referred to as `group_name/name` (see RefreshPlan.from_reports).
+
+    Reports over the same dataset share one refresh (see SharedDatasetRefreshes): the dataset is
+    refreshed once and every report on it goes on to its own export/email when that refresh ends.
+
+    `refresh_options` (or a report's own `refresh_options` entry in the yaml) sets the enhanced
+    refresh request, using the API field names:
+        refresh_options:
+          type: Full                  # Full, DataOnly, Calculate, ClearValues, Automatic, Defragment
+          commitMode: partialBatch    # or transactional
+          maxParallelism: 10
+          retryCount: 2
+          applyRefreshPolicy: true
+          objects:
+            - table: Sales
+              partition: Sales-2024Q4
+            - table: Customers
+    """
     with open(reports_yaml_file_path, 'r') as file:
         reports = yaml.safe_load(file).get('reports', [])
-        env = Variable.get("env")
-        if env == 'QA':
-            return print(f"Running in QA, skipping refresh for the following report(s):<br>{reports}")
-        for report in reports:
-            report_name = report.get('name')
-            group_name = report.get('group_name')
-            refresh = report.get('Refresh', True)
-            export_options = report.get('Export', [])
-            
-            # Convert list of dictionaries into a single dictionary for easier access
-            export_options_dict = {k: v for d in export_options for k, v in d.items()}
-            
-            pdf = export_options_dict.get('PDF', False)
-            png = export_options_dict.get('PNG', False)
-            pptx = export_options_dict.get('PPTX', False)
-
-            if refresh:
-                print(f"Refreshing {report_name} in Workspace {group_name}...")
-                # Pass use_app_link and app_id to the PowerBiRefresh constructor
-                power_bi_refresh = PowerBiRefresh(report_name, group_name, number_of_tries, tables=tables, 
-                                                use_app_link=use_app_link, app_id=app_id)  
-                power_bi_refresh.pbi_refresh()
-
-
-                if send_email_when_done:  
-                    report_id, webUrl = power_bi_refresh.get_report_id()
-                    
-                    # Use app URL if requested and available
-                    if use_app_link and app_id:
-                        app_url = power_bi_refresh.get_app_url()
-                        if app_url:
-                            link_url = app_url
-                            link_text = "View in Power BI App"
-                        else:
-                            link_url = webUrl
-                            link_text = "Link to Report"
-                    else:
-                        link_url = webUrl
-                        link_text = "Link to Report"
-
-                    html_content = f'''
-                    <div style="font-family: Arial, sans-serif; border: 2px solid #4CAF50; padding: 16px; border-radius: 8px; background-color: #f9f9f9;">
-                        <h2 style="color: #4CAF50;">Power BI Refresh: <span style="font-weight: bold;">{report_name} in Workspace: {group_name}</span> completed successfully.</h2>
-                        <p style="font-size: 18px;">Click the button below to view the report:</p>
-                        <br><a href="{link_url}" style="background-color: #4CAF50; color: white; padding: 14px 20px; margin: 8px 0; border: none; cursor: pointer; border-radius: 4px; text-decoration: none;">{link_text}</a><br>
-                    </div>
-                    '''
-
-                    body = html_content
-                    subject = f"Power BI Refresh: {report_name} in workspace {group_name} completed successfully."
-                
-                    files = []
-
-                    if pptx:
-                        if report_id is not None:
-                            files += [power_bi_refresh.export_report(report_name,report_id,"PPTX")]
-                        else:
-                            print("No report found for the dataset.")
-                    if png:
-                        if report_id is not None:
-                            files += [power_bi_refresh.export_report(report_name,report_id,"PNG")]
-                        else:
-                            print("No report found for the dataset.")
-                    if pdf:
-                        if report_id is not None:
-                            files += [power_bi_refresh.export_report(report_name,report_id,"PDF")]
-                        else:
-                            print("No report found for the dataset.")
-
-                    send_email(
-                                subject=subject,
-                                body=body,
-                                attachments=files
-                                )
+    env = Variable.get("env")
+    if env == 'QA':
+        return print(f"Running in QA, skipping refresh for the following report(s):<br>{reports}")
+    refresh_kwargs = dict(
+        number_of_tries=number_of_tries,
+        send_email_when_done=send_email_when_done,
+        tables=tables,
+        use_app_link=use_app_link,
+        app_id=app_id,
+        refresh_options=refresh_options,
+        shared_refreshes=SharedDatasetRefreshes()
+    )
+    if skip_unchanged_sources:
+        try:
+            from .bi_db import get_tables_last_altered
+        except:
+            from bi_db import get_tables_last_altered
+        source_tables = [
+            source if isinstance(source, str) else source.get('table')
+            for report in reports for source in report.get('source_tables') or []
+        ]
+        refresh_kwargs['source_last_altered'] = get_tables_last_altered(source_tables)
+    if parallel:
+        _refresh_yaml_reports_in_parallel(reports, max_concurrency, max_concurrency_per_workspace, **refresh_kwargs)
+        return
+    if any(report.get('depends_on') for report in reports):
+        _refresh_yaml_reports_in_parallel(reports, 1, 1, **refresh_kwargs)
+        return
+    failures = []
+    for report in reports:
+        try:
+            _refresh_yaml_report(report, **refresh_kwargs)
+        except Exception as e:
+            print(f"Error refreshing {report.get('name')}: {str(e)}")
+            failures.append(f"{report.get('name')}: {str(e)}")
+    if failures:
+        raise RuntimeError("Power BI refresh failed for:\n" + "\n".join(failures))
 
 
+@publishes_run_metrics("report_refresh_noyaml")
 def report_refresh_noyaml(
                     number_of_tries: int = 35,
                     send_email_when_done: bool = False,
@@ -579,7 +1346,8 @@ def report_refresh_noyaml(
                     email_recipients: str = None,
                     tables: list = None,
                     use_app_link: bool = False,
-                    app_id: str = None
+                    app_id: str = None,
+                    refresh_options: dict = None
                           ) -> None:
                           
     # if env == 'QA':
@@ -597,13 +1365,14 @@ def report_refresh_noyaml(
 
     if refresh:
         print(f"Refreshing {report_name} in Workspace {group_name}...")
+        refresh_request = RefreshRequest.from_options(refresh_options) if refresh_options else None
         power_bi_refresh = PowerBiRefresh(report_name, group_name, number_of_tries, tables=tables,
-                                         use_app_link=use_app_link, app_id=app_id)  
+                                         use_app_link=use_app_link, app_id=app_id, refresh_request=refresh_request)  
         power_bi_refresh.pbi_refresh()
 
 
         if send_email_when_done:  
-            report_id, webUrl = power_bi_refresh.get_report_id()
+            report_id, webUrl = power_bi_refresh.report_id, power_bi_refresh.report_url
             
             # Use app URL if requested and available
             if use_app_link and app_id:
@@ -631,19 +1400,11 @@ def report_refresh_noyaml(
         
             files = []
 
-            if pptx:
-                if report_id is not None:
-                    files += [power_bi_refresh.export_report(report_name,report_id,"PPTX")]
-                else:
-                    print("No report found for the dataset.")
-            if png:
+            # Export all requested formats together
+            formats = [format_type for format_type, wanted in (("PPTX", pptx), ("PNG", png), ("PDF", pdf)) if wanted]
+            if formats:
                 if report_id is not None:
-                    files += [power_bi_refresh.export_report(report_name,report_id,"PNG")]
-                else:
-                    print("No report found for the dataset.")
-            if pdf:
-                if report_id is not None:
-                    files += [power_bi_refresh.export_report(report_name,report_id,"PDF")]
+                    files = export_files(power_bi_refresh, formats)
                 else:
                     print("No report found for the dataset.")
             if email_recipients is not None:
@@ -661,6 +1422,7 @@ def report_refresh_noyaml(
                             )
 
 
+@publishes_run_metrics("send_report_as_embedded_image")
 def send_report_as_embedded_image(
     report_name: str,
     group_name: str,
@@ -671,7 +1433,9 @@ def send_report_as_embedded_image(
     include_pdf: bool = True,  # New parameter to control PDF export
     number_of_tries: int = 5,
     use_app_link: bool = False,  # New parameter to use app link instead of direct report link
-    app_id: str = None  # App ID for creating the app link
+    app_id: str = None,  # App ID for creating the app link
+    use_export_cache: bool = True,  # Reuse earlier exports while the dataset hasn't refreshed
+    image_processing=None  # bi_pbi_image.ImageProcessing to shrink the inline image before sending
 ) -> None:
     """
     Exports Power BI report pages as PNG for inline display and optionally as PDF for attachment.
@@ -687,12 +1451,15 @@ def send_report_as_embedded_image(
         number_of_tries: Number of refresh attempts
         use_app_link: Whether to use app link instead of direct report link (optional)
         app_id: App ID for creating the app link (required if use_app_link is True)
+        use_export_cache: Reuse files from an earlier export of the same pages and format when the
+            dataset hasn't refreshed since (default True, see bi_pbi_cache.get_export_cache)
+        image_processing: bi_pbi_image.ImageProcessing settings to split/stitch pages, downscale
+            and recompress the PNG before it is inlined (optional, requires Pillow)
     """
     # Initialize PowerBI connection with app link options
     power_bi = PowerBiRefresh(report_name, group_name, number_of_tries, use_app_link=use_app_link, app_id=app_id)
     
-    # Get report ID first
-    power_bi.report_id, power_bi.report_url = power_bi.get_report_id()
+    # Resolve the report (and its pages) once; report_id and report_pages are memoized from here on
     if power_bi.report_id is None:
         print(f"Error: Could not find report ID for {report_name}")
         return
@@ -703,17 +1470,7 @@ def send_report_as_embedded_image(
             pages = [power_bi.report_pages[0]['displayName']]
         
         # Convert display names to internal names if needed
-        page_names = []
-        for page in pages:
-            # Find matching page from report_pages
-            matching_page = next(
-                (p for p in power_bi.report_pages if p['displayName'].lower() == page.lower()),
-                None
-            )
-            if matching_page:
-                page_names.append(matching_page['name'])
-            else:
-                print(f"Warning: Page '{page}' not found in report")
+        page_names = power_bi.resolve_page_names(pages)
         
         if not page_names:
             print("No valid pages found to export")
@@ -721,32 +1478,41 @@ def send_report_as_embedded_image(
             
         print(f"Exporting pages: {', '.join(pages)}")
         
-        # Export PNG for inline display
-        power_bi.format_type = "PNG"
-        power_bi.pages_to_export = page_names  # Pass the page names to export
-        png_file = power_bi.export_report()
+        # Export PNG for inline display and, if requested, the PDF attachment at the same time
+        formats = ["PNG", "PDF"] if include_pdf else ["PNG"]
+        exported_files = export_files(power_bi, formats, page_names, export_cache=get_export_cache() if use_export_cache else None)
+        png_file = exported_files[0]
         
         # Verify the PNG file exists and has content
         if not Path(png_file).exists() or Path(png_file).stat().st_size == 0:
             print(f"Error: PNG file is empty or does not exist: {png_file}")
             return
         
-        # Initialize attachments list and add PNG
-        attachments = [png_file]
+        # Multi-page exports arrive as a zip of PNGs; post-processing turns them into inline images
+        image_files = [png_file]
+        if image_processing is not None:
+            try:
+                from .bi_pbi_image import process_report_image
+            except:
+                from bi_pbi_image import process_report_image
+            image_files = process_report_image(png_file, image_processing)
         
-        # Export PDF for attachment if requested
+        # Initialize attachments list and add the images
+        attachments = list(image_files)
+        
+        # Add the PDF attachment if requested
         pdf_file = None
         if include_pdf:
-            print("\nExporting PDF version for attachment...")
-            pdf_file = power_bi.export_report(format_type="PDF")
+            pdf_file = exported_files[1]
             attachments.append(pdf_file)
         
         # Generate default subject if none provided
         if subject is None:
             subject = f"Power BI Report: {report_name}"
         
-        # Create a unique Content-ID for the image
-        content_id = f"report_image_{int(time.time())}"
+        # Create a unique Content-ID for each image
+        content_ids = {image_file: f"report_image_{int(time.time())}_{number}" for number, image_file in enumerate(image_files, start=1)}
+        images_html = "".join(f'<img src="cid:{content_id}" style="max-width: 100%; height: auto;" />' for content_id in content_ids.values())
         
         # Determine which URL to use in the email
         if use_app_link and app_id:
@@ -771,7 +1537,7 @@ def send_report_as_embedded_image(
                 {f'<a href="{link_url}" style="color: #4CAF50; text-decoration: none;">{link_text}</a>' if link_url else ''}
             </div>
             <div>
-                <img src="cid:{content_id}" style="max-width: 100%; height: auto;" />
+                {images_html}
             </div>
         </div>
         """
@@ -782,7 +1548,7 @@ def send_report_as_embedded_image(
             body=html_content,
             email=recipients,
             attachments=attachments,  # List of attachments
-            content_ids={png_file: content_id}  # Only PNG is inline
+            content_ids=content_ids  # Only the images are inline
         )
         
         # Clean up the temporary files
@@ -798,6 +1564,112 @@ def send_report_as_embedded_image(
         print(f"Error during export and email process: {str(e)}")
         raise
 
+@publishes_run_metrics("burst_report")
+def burst_report(
+    report_name: str,
+    group_name: str,
+    bursts: dict,
+    format_type: str = "PDF",
+    pages: list = None,
+    subject: str = None,
+    body: str = None,
+    output_dir: str = None,
+    max_email_workers: int = 4,
+    use_export_cache: bool = True,
+    image_processing=None
+) -> dict:
+    """
+    Exports one report once per filter or parameter set and emails each copy to its own recipients.
+
+    All ExportTo jobs are submitted together (bounded per capacity by
+    bi_pbi_export.set_capacity_export_limit) and each recipient's email goes out as soon as their
+    export is downloaded, so a large burst takes about as long as a few exports, not all of them
+    in a row.
+
+    Args:
+        report_name: Name of the Power BI report
+        group_name: Name of the workspace
+        bursts: {label: options}, one entry per output. Options:
+            recipients: Email address(es) that receive this output.
+            filter: OData report-level filter for Power BI reports, e.g. "Store/Territory eq 'NC'".
+            parameters: {name: value} for paginated reports (used instead of `filter` and `pages`).
+        format_type: Export format, e.g. "PDF", "PNG" or "PPTX" (default PDF)
+        pages: Page display names to export (optional, defaults to the first page)
+        subject: Email subject; "{label}" is replaced by the burst label (optional)
+        body: Email body HTML; "{label}" is replaced by the burst label (optional)
+        output_dir: Folder for the exported files (optional, defaults to the working directory)
+        max_email_workers: Emails sent concurrently while exports are still running
+        use_export_cache: Reuse files from an earlier identical export when the dataset hasn't
+            refreshed since (default True)
+        image_processing: bi_pbi_image.ImageProcessing applied to PNG outputs on the email
+            workers before they are sent (optional, requires Pillow)
+
+    Returns:
+        {label: {'status': 'Sent' or 'Failed', 'file': path or None, 'error': message or None}}
+
+    Example:
+        burst_report("Sales Dashboard", "Finance", {
+            "NC": {"filter": "Store/Territory eq 'NC'", "recipients": ["nc@test.com"]},
+            "SC": {"filter": "Store/Territory eq 'SC'", "recipients": ["sc@test.com"]},
+        })
+    """
+    power_bi = PowerBiRefresh(report_name, group_name)
+    if power_bi.report_id is None:
+        raise ValueError(f"Could not find report ID for {report_name}")
+    paginated = any(options.get('parameters') is not None for options in bursts.values())
+    page_names = None if paginated else power_bi.resolve_page_names(pages)
+    if not paginated and not page_names:
+        raise ValueError(f"No valid pages found to export for {report_name}")
+
+    jobs = []
+    for label, options in bursts.items():
+        file_name = f"{report_name} - {label}.{format_type.lower()}"
+        if output_dir:
+            file_name = str(Path(output_dir) / file_name)
+        jobs.append(ExportJob(
+            power_bi, format_type, page_names, file_name,
+            report_filter=options.get('filter'),
+            parameter_values=options.get('parameters'),
+            context=label
+        ))
+
+    results = {}
+    results_lock = threading.Lock()
+
+    def deliver(job):
+        label = job.context
+        recipients = bursts[label].get('recipients')
+        try:
+            if job.error is not None:
+                raise job.error
+            attachments = [job.file_name]
+            if image_processing is not None and format_type == "PNG":
+                try:
+                    from .bi_pbi_image import process_report_image
+                except:
+                    from bi_pbi_image import process_report_image
+                attachments = process_report_image(job.file_name, image_processing)
+            send_email(
+                subject=(subject or f"Power BI Report: {report_name} - {{label}}").replace("{label}", str(label)),
+                body=(body or f"<p>{report_name} for {label} is attached.</p>").replace("{label}", str(label)),
+                attachments=attachments,
+                email=recipients
+            )
+            result = {'status': 'Sent', 'file': job.file_name, 'error': None}
+        except Exception as e:
+            print(f"Burst {label} of {report_name} failed: {str(e)}")
+            result = {'status': 'Failed', 'file': job.file_name if job.error is None else None, 'error': str(e)}
+        with results_lock:
+            results[label] = result
+
+    print(f"Bursting {report_name} into {len(jobs)} {format_type} exports...")
+    with ThreadPoolExecutor(max_workers=max_email_workers) as email_pool:
+        run_exports(jobs, export_cache=get_export_cache() if use_export_cache else None, on_done=lambda job: email_pool.submit(bind_run_metrics(deliver), job))
+    failed = [label for label, result in results.items() if result['status'] != 'Sent']
+    print(f"Burst of {report_name} finished: {len(results) - len(failed)} sent, {len(failed)} failed")
+    return results
+
+
 if __name__ == "__main__":
     # Test 1: Send a report as embedded image with app link
     # print("\n=== Testing send_report_as_embedded_image with app link ===")
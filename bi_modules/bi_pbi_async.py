@@ -0,0 +1,367 @@
+import asyncio
+import datetime
+import os
+import time
+import weakref
+from pathlib import Path
+import httpx
+try:
+    from . import bi_http
+except:
+    import bi_http
+try:
+    from .bi_pbi import PBI_API_URL, PowerBiTokenManager, RefreshRequest, get_token_manager, build_refresh_body, build_export_body, refresh_status_from_history, estimate_refresh_duration, AdaptivePollSchedule, REFRESH_TERMINAL_STATUSES
+except:
+    from bi_pbi import PBI_API_URL, PowerBiTokenManager, RefreshRequest, get_token_manager, build_refresh_body, build_export_body, refresh_status_from_history, estimate_refresh_duration, AdaptivePollSchedule, REFRESH_TERMINAL_STATUSES
+try:
+    from .bi_pbi_cache import PowerBiMetadataCache, get_metadata_cache
+except:
+    from bi_pbi_cache import PowerBiMetadataCache, get_metadata_cache
+try:
+    from .bi_pbi_governor import get_governor
+except:
+    from bi_pbi_governor import get_governor
+try:
+    from .bi_pbi_metrics import get_run_metrics
+except:
+    from bi_pbi_metrics import get_run_metrics
+
+
+################################################################################################################################
+# asyncio counterpart of PowerBiRefresh.
+#
+# Every AsyncPowerBiRefresh running on the same event loop shares one httpx.AsyncClient, so a
+# single loop can drive hundreds of refreshes/exports over a bounded pool of keep-alive
+# connections. Tokens and name -> id lookups come from the same token manager and metadata
+# cache as the synchronous class.
+
+ASYNC_POOL_SIZE = 100
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Returns the pooled client for the running event loop (httpx clients cannot cross loops)."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=ASYNC_POOL_SIZE, max_keepalive_connections=ASYNC_POOL_SIZE),
+            timeout=httpx.Timeout(bi_http.DEFAULT_TIMEOUT[1], connect=bi_http.DEFAULT_TIMEOUT[0])
+        )
+        _clients[loop] = client
+    return client
+
+
+async def async_request(
+    method: str,
+    url: str,
+    token_provider=None,
+    max_retries: int = None,
+    retry_status_codes: tuple = bi_http.RETRY_STATUS_CODES,
+    rate_limiter=None,
+    max_throttle_retries: int = bi_http.DEFAULT_MAX_THROTTLE_RETRIES,
+    metrics=None,
+    retry_non_idempotent: bool = False,
+    stream: bool = False,
+    **kwargs
+) -> httpx.Response:
+    """
+    Async version of bi_http.request with the same retry, 401 and 429 behaviour (both use
+    bi_http.RetryState). `token_provider` is a coroutine function with the same signature as
+    the sync one, and `rate_limiter` is waited on with acquire_async() so the event loop is
+    never blocked, and `metrics` gets the same record_call() as in bi_http.request. With stream=True
+    the body is not read; the caller iterates it and must aclose() the response.
+    """
+    if max_retries is None:
+        max_retries = bi_http.configured_max_retries()
+    headers = dict(kwargs.pop('headers', None) or {})
+    client = get_async_client()
+    if token_provider is not None:
+        headers['Authorization'] = await token_provider()
+
+    retry = bi_http.RetryState(method, url, max_retries, retry_status_codes, max_throttle_retries, token_provider is not None, rate_limiter is not None, retry_non_idempotent)
+    while True:
+        if rate_limiter is not None:
+            await rate_limiter.acquire_async(method, url)
+        try:
+            response = await client.send(client.build_request(method, url, headers=headers, **kwargs), stream=stream)
+        except httpx.TransportError as e:
+            delay = retry.on_error(e, connect_error=isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout)))
+            if delay is None:
+                retry.record(metrics)
+                raise
+            await asyncio.sleep(delay)
+            continue
+
+        action, delay = retry.on_response(response)
+        if action == 'done':
+            retry.record(metrics, response)
+            return response
+        await response.aclose()
+        if action == 'refresh_token':
+            headers['Authorization'] = await token_provider(stale_token=headers['Authorization'])
+        elif action == 'throttled' and rate_limiter is not None:
+            rate_limiter.on_throttled(method, url, delay)
+        else:
+            await asyncio.sleep(delay)
+
+
+class AsyncPowerBiRefresh:
+    """
+    Resolves, refreshes and exports one Power BI report without blocking a thread.
+
+    Usage:
+        power_bi = await AsyncPowerBiRefresh("Sales Dashboard", "Finance").resolve()
+        status = await power_bi.pbi_refresh()
+        pdf_file = await power_bi.export_report("PDF")
+    """
+    def __init__(self, report_name: str, group_name: str, timeout_minutes: int = 35, tables: list = None, token_manager: PowerBiTokenManager = None, metadata_cache: PowerBiMetadataCache = None, refresh_request: RefreshRequest = None):
+        self.report_name = report_name
+        self.group_name = group_name
+        self.timeout_minutes = timeout_minutes
+        self.tables = tables
+        self.refresh_request = refresh_request
+        self.refresh_request_id = None
+        self.token_manager = token_manager or get_token_manager()
+        self.metadata_cache = metadata_cache or get_metadata_cache()
+        self.group_id = None
+        self.dataset_id = None
+        self.report_id = None
+        self.report_url = None
+        self.report_pages = []
+        self.refresh_triggered_at = None
+
+    async def _bearer(self, stale_token: str = None) -> str:
+        api_token, _, _ = await self.token_manager.get_token_async(stale_token)
+        return api_token
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return await async_request(method, url, token_provider=self._bearer, rate_limiter=get_governor(), metrics=get_run_metrics(), **kwargs)
+
+    async def resolve(self):
+        """Looks up the group, dataset and report ids (free when the metadata cache is warm)."""
+        self.group_id = await self.get_group_id()
+        if self.group_id is None:
+            raise ValueError(f"Workspace {self.group_name} not found")
+        workspace = await self.get_workspace_metadata(self.report_name)
+        self.dataset_id = workspace['datasets'].get(self.report_name)
+        report = workspace['reports'].get(self.report_name)
+        if report is not None:
+            self.report_id, self.report_url = report['id'], report['webUrl']
+            self.dataset_id = report['datasetId']
+            self.report_pages = await self.get_report_pages(self.report_id) or []
+        return self
+
+    async def get_group_id(self):
+        cache_key = f"group:{self.group_name.lower()}"
+        group_id = self.metadata_cache.get(cache_key)
+        if group_id is not None:
+            return group_id
+        group_filter = self.group_name.replace("'", "''")
+        response = await self._request("GET", f"{PBI_API_URL}/groups", params={"$filter": f"name eq '{group_filter}'"})
+        groups = response.json()['value'] if response.status_code == 200 else []
+        if not groups:
+            response = await self._request("GET", f"{PBI_API_URL}/groups")
+            response.raise_for_status()
+            groups = response.json()['value']
+        self.metadata_cache.set_many({f"group:{group['name'].lower()}": group['id'] for group in groups})
+        return self.metadata_cache.get(cache_key)
+
+    async def get_workspace_metadata(self, name: str = None) -> dict:
+        """
+        Datasets and reports of the workspace, sharing the datasets:/reports: cache entries with
+        PowerBiRefresh. When `name` is in neither cached listing, both are listed again.
+        """
+        datasets = self.metadata_cache.get(f"datasets:{self.group_id}")
+        reports = self.metadata_cache.get(f"reports:{self.group_id}")
+        if name is not None and datasets is not None and reports is not None and name not in datasets and name not in reports:
+            datasets = reports = None
+        calls = {}
+        if datasets is None:
+            calls['datasets'] = self._request("GET", f"{PBI_API_URL}/groups/{self.group_id}/datasets")
+        if reports is None:
+            calls['reports'] = self._request("GET", f"{PBI_API_URL}/groups/{self.group_id}/reports")
+        responses = dict(zip(calls, await asyncio.gather(*calls.values())))
+        for response in responses.values():
+            response.raise_for_status()
+        if 'datasets' in responses:
+            datasets = {dataset['name']: dataset['id'] for dataset in responses['datasets'].json()['value']}
+            self.metadata_cache.set(f"datasets:{self.group_id}", datasets)
+        if 'reports' in responses:
+            reports = {
+                report['name']: {
+                    'id': report['id'],
+                    'webUrl': report.get('webUrl'),
+                    'datasetId': report.get('datasetId')
+                } for report in responses['reports'].json()['value']
+            }
+            self.metadata_cache.set(f"reports:{self.group_id}", reports)
+        return {'datasets': datasets, 'reports': reports}
+
+    async def get_report_pages(self, report_id: str):
+        cache_key = f"pages:{report_id}"
+        pages = self.metadata_cache.get(cache_key)
+        if pages is not None:
+            return pages
+        response = await self._request("GET", f"{PBI_API_URL}/groups/{self.group_id}/reports/{report_id}/pages")
+        if response.status_code != 200:
+            return None
+        pages = [{'displayName': page['displayName'], 'name': page['name']} for page in response.json()['value']]
+        self.metadata_cache.set(cache_key, pages)
+        return pages
+
+    async def refresh_dataset(self) -> httpx.Response:
+        url = f"{PBI_API_URL}/groups/{self.group_id}/datasets/{self.dataset_id}/refreshes"
+        body = build_refresh_body(self.tables, self.refresh_request)
+        self.refresh_triggered_at = datetime.datetime.now(datetime.timezone.utc)
+        if body is not None:
+            response = await self._request("POST", url, json=body)
+        else:
+            response = await self._request("POST", url)
+        location = response.headers.get('Location')
+        self.refresh_request_id = location.rstrip('/').split('/')[-1] if location else None
+        if response.status_code != 202:
+            # Nothing new was queued (e.g. 400, a refresh is already in progress): follow the newest history entry
+            self.refresh_triggered_at = None
+        return response
+
+    async def cancel_refresh(self, request_id: str = None) -> httpx.Response:
+        request_id = request_id or self.refresh_request_id
+        if request_id is None:
+            raise ValueError("Only enhanced refreshes (started with tables or a RefreshRequest) can be cancelled")
+        response = await self._request("DELETE", f"{PBI_API_URL}/groups/{self.group_id}/datasets/{self.dataset_id}/refreshes/{request_id}")
+        if response.status_code not in [200, 202]:
+            raise ValueError(f"Failed to cancel refresh {request_id}, received status code: {response.status_code}")
+        return response
+
+    async def get_refresh_history(self, top: int = 10):
+        url = f"{PBI_API_URL}/groups/{self.group_id}/datasets/{self.dataset_id}/refreshes"
+        response = await self._request("GET", url, params={"$top": top})
+        if response.status_code != 200:
+            return None
+        return response.json()['value']
+
+    async def refresh_status(self):
+        return refresh_status_from_history(await self.get_refresh_history(top=1), self.refresh_triggered_at)
+
+    async def wait_for_refresh(self, history_size: int = 10):
+        """Waits for the current refresh with the same history-based schedule as PowerBiRefresh."""
+        deadline = time.monotonic() + self.timeout_minutes * 60
+        history = await self.get_refresh_history(top=history_size) or []
+        status = refresh_status_from_history(history, self.refresh_triggered_at)
+        schedule = AdaptivePollSchedule(*estimate_refresh_duration(history))
+        started = self.refresh_triggered_at or datetime.datetime.now(datetime.timezone.utc)
+        delay = schedule.first_delay()
+        while status not in REFRESH_TERMINAL_STATUSES:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(delay, remaining))
+            status = await self.refresh_status()
+            delay = schedule.next_delay((datetime.datetime.now(datetime.timezone.utc) - started).total_seconds())
+        print(f"Status Check for {self.report_name}: {status}")
+        return status
+
+    async def pbi_refresh(self):
+        if self.group_id is None:
+            await self.resolve()
+        refresh_response = await self.refresh_dataset()
+        if refresh_response.status_code == 202:
+            print(f"Refresh Response for {self.report_name}: Success, refresh is in progress.")
+        elif refresh_response.status_code == 400:
+            print(f"Refresh Response: A refresh for dataset belonging to {self.report_name} is already in progress. ")
+        else:
+            print(f"Refresh Response for {self.report_name}: Failed, received status code: ", refresh_response.status_code)
+        return await self.wait_for_refresh()
+
+    async def start_export(self, format_type: str = "PNG", page_names: list = None) -> str:
+        page_names = page_names or [self.report_pages[0]['name']]
+        response = await self._request(
+            "POST",
+            f"{PBI_API_URL}/groups/{self.group_id}/reports/{self.report_id}/ExportTo",
+            headers={"Accept": "application/json"},
+            json=build_export_body(format_type, page_names)
+        )
+        if response.status_code != 202:
+            print(f"Error response content: {response.text}")
+            raise ValueError(f"Export request failed with status code: {response.status_code}")
+        return response.json()['id']
+
+    async def export_status(self, export_id: str) -> dict:
+        response = await self._request(
+            "GET",
+            f"{PBI_API_URL}/groups/{self.group_id}/reports/{self.report_id}/exports/{export_id}",
+            headers={"Accept": "application/json"}
+        )
+        if response.status_code not in [200, 202]:
+            raise ValueError(f"Failed to get export status with status code: {response.status_code}")
+        return response.json()
+
+    async def download_export(self, export_id: str, file_name: str) -> str:
+        """Streams the export file to `file_name` through a temporary file, removed if the download fails."""
+        url = f"{PBI_API_URL}/groups/{self.group_id}/reports/{self.report_id}/exports/{export_id}/file"
+        tmp_path = f"{file_name}.{os.getpid()}.{id(self)}.part"
+        response = await self._request("GET", url, stream=True)
+        try:
+            if response.status_code != 200:
+                await response.aread()
+                raise ValueError(f"Failed to get export file with status code: {response.status_code}")
+            content_length = response.headers.get('Content-Length') if not response.headers.get('Content-Encoding') else None
+            with open(tmp_path, "wb") as f:
+                async for chunk in response.aiter_bytes(1024 * 1024):
+                    f.write(chunk)
+            file_size = Path(tmp_path).stat().st_size
+            if file_size == 0 or (content_length is not None and int(content_length) != file_size):
+                raise ValueError(f"Export download incomplete: received {file_size} bytes")
+            os.replace(tmp_path, file_name)
+        except BaseException:
+            # Also covers cancellation, so an abandoned download never leaves a .part file behind
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            await response.aclose()
+        return file_name
+
+    async def export_report(self, format_type: str = "PNG", page_names: list = None, file_name: str = None, poll_interval: int = 5, timeout_seconds: int = 150) -> str:
+        if self.report_id is None:
+            await self.resolve()
+        if not self.report_id:
+            raise ValueError(f"No report ID available for report {self.report_name}")
+        export_id = await self.start_export(format_type, page_names)
+        deadline = time.monotonic() + timeout_seconds
+        status = None
+        while time.monotonic() < deadline:
+            status = (await self.export_status(export_id)).get('status', '')
+            if status in ["Succeeded", "Failed"]:
+                break
+            await asyncio.sleep(poll_interval)
+        if status == "Failed":
+            raise ValueError("Export failed")
+        elif status != "Succeeded":
+            raise ValueError("Export timed out")
+        file_name = file_name or f"{self.report_name}.{format_type.lower()}"
+        return await self.download_export(export_id, file_name)
+
+
+async def refresh_reports_async(reports: list, max_concurrency: int = 50, timeout_minutes: int = 35) -> dict:
+    """
+    Refreshes many reports on one event loop.
+
+    Args:
+        reports: List of dicts with 'name' and 'group_name' keys (the reports.yaml layout).
+        max_concurrency: Maximum number of refreshes in flight at once.
+
+    Returns:
+        Dict of report name -> final refresh status, or the exception raised for that report.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(report):
+        async with semaphore:
+            power_bi = AsyncPowerBiRefresh(report['name'], report['group_name'], timeout_minutes=timeout_minutes, tables=report.get('tables'))
+            return await power_bi.pbi_refresh()
+
+    results = await asyncio.gather(*(run(report) for report in reports), return_exceptions=True)
+    return {report['name']: result for report, result in zip(reports, results)}
@@ -0,0 +1,214 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+
+################################################################################################################################
+
+class PowerBiMetadataCache:
+    """
+    Name -> id lookups for Power BI workspaces, datasets, reports and report pages.
+
+    Entries live in memory and, when `path` is given, are mirrored to a JSON file so the
+    next flow run on the same host starts warm. Every entry expires after `ttl_seconds`.
+
+    Keys used by PowerBiRefresh:
+        group:<group name lower>   -> group id
+        datasets:<group id>        -> {dataset name: id}
+        reports:<group id>         -> {report name: {"id": ..., "webUrl": ..., "datasetId": ...}}
+        pages:<report id>          -> [{"displayName": ..., "name": ...}]
+    """
+    def __init__(self, ttl_seconds: int = 3600, path: str = None):
+        self.ttl_seconds = ttl_seconds
+        self.path = Path(path) if path else None
+        self._entries = {}
+        self._lock = threading.Lock()
+        if self.path is not None:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                self._entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Ignoring unreadable Power BI metadata cache {self.path}: {e}")
+
+    def _save(self):
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.path)
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry['stored_at'] > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            return entry['value']
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._entries[key] = {'stored_at': time.time(), 'value': value}
+            self._save()
+
+    def set_many(self, values: dict):
+        with self._lock:
+            stored_at = time.time()
+            for key, value in values.items():
+                self._entries[key] = {'stored_at': stored_at, 'value': value}
+            self._save()
+
+    def invalidate(self, prefix: str = None):
+        """Drops every entry, or only the ones whose key starts with `prefix` (e.g. 'reports:<id>')."""
+        with self._lock:
+            if prefix is None:
+                self._entries = {}
+            else:
+                self._entries = {k: v for k, v in self._entries.items() if not k.startswith(prefix)}
+            self._save()
+
+
+_metadata_cache = None
+_metadata_cache_lock = threading.Lock()
+
+
+def get_metadata_cache() -> PowerBiMetadataCache:
+    """
+    Returns the process-wide metadata cache.
+
+    Set PBI_METADATA_CACHE_PATH to persist it to disk and PBI_METADATA_CACHE_TTL (seconds)
+    to change how long entries stay valid.
+    """
+    global _metadata_cache
+    with _metadata_cache_lock:
+        if _metadata_cache is None:
+            _metadata_cache = PowerBiMetadataCache(
+                ttl_seconds=int(os.environ.get('PBI_METADATA_CACHE_TTL', 3600)),
+                path=os.environ.get('PBI_METADATA_CACHE_PATH')
+            )
+        return _metadata_cache
+
+
+################################################################################################################################
+
+class ExportCache:
+    """
+    Size-bounded, least-recently-used store of exported report files on local disk.
+
+    Keys come from PowerBiRefresh.export_cache_key(), which combines the report id, the export
+    request body (format, pages, settings, filters) and the end time of the dataset's last
+    successful refresh, so a cached file is only reused while the data behind it is unchanged.
+    Cached files are copied out to the requested path, never handed out directly.
+    """
+    def __init__(self, directory: str, max_bytes: int = 2 * 1024 ** 3):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.index_path = self.directory / 'index.json'
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._index = self._load_index()
+
+    def _load_index(self) -> dict:
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f"Ignoring unreadable export cache index {self.index_path}: {e}")
+            return {}
+
+    def _save_index(self):
+        tmp_path = self.index_path.with_name(f"index.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def get(self, key: str, target_path: str):
+        """Copies the cached file for `key` to `target_path` and returns it, or None on a miss."""
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            cached_path = self.directory / entry['file']
+            if not cached_path.exists():
+                del self._index[key]
+                self._save_index()
+                return None
+            shutil.copyfile(cached_path, target_path)
+            entry['last_used'] = time.time()
+            self._save_index()
+        print(f"Export cache hit: {target_path}")
+        return target_path
+
+    def put(self, key: str, source_path: str):
+        """Stores a copy of `source_path` under `key`, evicting least recently used files over max_bytes."""
+        if key is None:
+            return
+        size = Path(source_path).stat().st_size
+        if size > self.max_bytes:
+            return
+        file_name = f"{key}{Path(source_path).suffix}"
+        tmp_path = self.directory / f".{file_name}.{os.getpid()}.{threading.get_ident()}.part"
+        shutil.copyfile(source_path, tmp_path)
+        with self._lock:
+            os.replace(tmp_path, self.directory / file_name)
+            self._index[key] = {'file': file_name, 'size': size, 'last_used': time.time()}
+            self._evict()
+            self._save_index()
+
+    def _evict(self):
+        total = sum(entry['size'] for entry in self._index.values())
+        for key, entry in sorted(self._index.items(), key=lambda item: item[1]['last_used']):
+            if total <= self.max_bytes:
+                break
+            try:
+                (self.directory / entry['file']).unlink()
+            except FileNotFoundError:
+                pass
+            total -= entry['size']
+            del self._index[key]
+
+    def clear(self):
+        with self._lock:
+            for entry in self._index.values():
+                try:
+                    (self.directory / entry['file']).unlink()
+                except FileNotFoundError:
+                    pass
+            self._index = {}
+            self._save_index()
+
+
+_export_cache = None
+
+
+def get_export_cache() -> ExportCache:
+    """
+    Returns the process-wide export cache.
+
+    Set PBI_EXPORT_CACHE_DIR to choose where files are kept (defaults to a folder in the
+    system temp directory) and PBI_EXPORT_CACHE_MAX_MB to bound its size (default 2048).
+    """
+    global _export_cache
+    with _metadata_cache_lock:
+        if _export_cache is None:
+            _export_cache = ExportCache(
+                directory=os.environ.get('PBI_EXPORT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'bi_modules_export_cache')),
+                max_bytes=int(os.environ.get('PBI_EXPORT_CACHE_MAX_MB', 2048)) * 1024 ** 2
+            )
+        return _export_cache
@@ -0,0 +1,71 @@
+import datetime
+import re
+import pyarrow as pa
+
+
+################################################################################################################################
+# Result handling for the datasets executeQueries endpoint (PowerBiRefresh.execute_dax).
+#
+# The service returns every row as a JSON object keyed by "Table[Column]" and drops the column
+# types, so rows are turned into Arrow columns here: numbers and booleans are inferred by Arrow,
+# ISO timestamps are parsed back into datetimes, and column names are shortened to "Column".
+
+DAX_MAX_ROWS = 100000  # executeQueries returns at most this many rows per query
+DAX_PAGE_SIZE = 20000  # rows per execute_dax_paged page, keeps up to 50 columns under the 1M values per query limit
+DAX_OUTPUTS = ('arrow', 'pandas', 'rows')
+
+_ISO_DATETIME = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?(Z|[+-]\d{2}:\d{2})?$')
+
+
+def build_dax_body(query: str, include_nulls: bool = True, impersonated_user_name: str = None) -> dict:
+    body = {
+        "queries": [{"query": query}],
+        "serializerSettings": {"includeNulls": include_nulls}
+    }
+    if impersonated_user_name:
+        body["impersonatedUserName"] = impersonated_user_name
+    return body
+
+
+def topnskip_query(table_expression: str, order_by: str, page_size: int, skip: int) -> str:
+    """One page of `table_expression`, ordered by `order_by` so pages don't overlap."""
+    return f"EVALUATE TOPNSKIP({page_size}, {skip}, {table_expression}, {order_by})\nORDER BY {order_by}"
+
+
+def column_name(key: str) -> str:
+    """'Sales[Amount]' -> 'Amount', '[Total Sales]' -> 'Total Sales'."""
+    match = re.search(r'\[([^\]]*)\]$', key)
+    return match.group(1) if match else key
+
+
+def _typed_values(values: list) -> list:
+    present = [value for value in values if value is not None]
+    if present and all(isinstance(value, str) and _ISO_DATETIME.match(value) for value in present):
+        return [None if value is None else datetime.datetime.fromisoformat(value.replace('Z', '+00:00')) for value in values]
+    return values
+
+
+def rows_to_arrow(rows: list, short_column_names: bool = True) -> pa.Table:
+    """Builds a typed Arrow table from executeQueries rows (missing keys become nulls)."""
+    keys = []
+    for row in rows:
+        for key in row:
+            if key not in keys:
+                keys.append(key)
+    names = [column_name(key) for key in keys] if short_column_names else keys
+    if len(set(names)) != len(names):
+        names = keys  # Same column name in two tables, keep them apart
+    columns = [pa.array(_typed_values([row.get(key) for row in rows])) for key in keys]
+    return pa.Table.from_arrays(columns, names=names)
+
+
+def format_dax_result(rows: list, output: str = 'arrow', short_column_names: bool = True):
+    """Returns rows as an Arrow table, a pandas DataFrame or the raw list of dicts."""
+    if output not in DAX_OUTPUTS:
+        raise ValueError(f"output must be one of {DAX_OUTPUTS}, got {output!r}")
+    if output == 'rows':
+        return rows
+    table = rows_to_arrow(rows, short_column_names)
+    if output == 'pandas':
+        return table.to_pandas()
+    return table
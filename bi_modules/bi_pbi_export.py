@@ -0,0 +1,181 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+try:
+    from .bi_pbi_metrics import get_run_metrics, bind_run_metrics
+except:
+    from bi_pbi_metrics import get_run_metrics, bind_run_metrics
+
+
+################################################################################################################################
+# Batch export pipeline for PowerBiRefresh.
+#
+# All requested exports (any mix of reports, formats and page sets) are submitted up front,
+# polled together from a single loop, and downloaded concurrently as each one succeeds.
+# Exports running on the same Power BI capacity share a process-wide slot limit, so parallel
+# report flows can't flood a capacity with ExportTo jobs.
+
+EXPORT_POLL_INTERVAL = 5  # seconds
+EXPORT_TIMEOUT = 600  # seconds per export
+CAPACITY_EXPORT_LIMIT = 5  # concurrent exports per capacity
+
+_capacity_slots = {}
+_capacity_slots_lock = threading.Lock()
+
+
+def set_capacity_export_limit(limit: int):
+    """Changes the per-capacity export limit. Call before the first export of the run."""
+    global CAPACITY_EXPORT_LIMIT
+    with _capacity_slots_lock:
+        CAPACITY_EXPORT_LIMIT = limit
+        _capacity_slots.clear()
+
+
+def _capacity_semaphore(capacity_key: str) -> threading.BoundedSemaphore:
+    with _capacity_slots_lock:
+        if capacity_key not in _capacity_slots:
+            _capacity_slots[capacity_key] = threading.BoundedSemaphore(CAPACITY_EXPORT_LIMIT)
+        return _capacity_slots[capacity_key]
+
+
+class ExportJob:
+    """
+    One export of a report in one format.
+
+    `report_filter` and `parameter_values` narrow the export (see bi_pbi.build_export_body), and
+    `context` is free for the caller, e.g. the recipients of a burst. After run_exports,
+    `file_name` holds the downloaded file, or `error` the reason it failed.
+    """
+    def __init__(self, power_bi, format_type: str = "PNG", page_names: list = None, file_name: str = None, report_filter: str = None, parameter_values: dict = None, context=None):
+        self.power_bi = power_bi
+        self.format_type = format_type
+        self.page_names = page_names
+        self.file_name = file_name
+        self.report_filter = report_filter
+        self.parameter_values = parameter_values
+        self.context = context
+        self.capacity_key = power_bi.get_capacity_key()
+        self.export_id = None
+        self.status = None
+        self.error = None
+        self.started = None
+        self.cache_key = None
+
+    def __repr__(self):
+        return f"ExportJob({self.power_bi.report_name!r}, {self.format_type!r}, status={self.status!r})"
+
+
+def run_exports(jobs: list, poll_interval: int = EXPORT_POLL_INTERVAL, timeout_seconds: int = EXPORT_TIMEOUT, max_download_workers: int = 8, export_cache=None, on_done=None) -> list:
+    """
+    Runs every ExportJob to completion and returns the same list.
+
+    Jobs are started as soon as their capacity has a free slot, polled together every
+    `poll_interval` seconds and downloaded on a thread pool the moment they succeed. Failures are
+    recorded on the job rather than raised, so one bad export doesn't lose the others.
+
+    With an `export_cache` (see bi_pbi_cache.ExportCache), jobs whose report, settings and dataset
+    refresh are unchanged since an earlier export are served from disk without calling ExportTo.
+
+    `on_done(job)`, if given, is called from the polling loop as soon as each job is finished
+    (downloaded, served from the cache or failed), so results can be used while others still run.
+    """
+    def finish(job):
+        if on_done is None:
+            return
+        try:
+            on_done(job)
+        except Exception as e:
+            print(f"Export callback for {job.power_bi.report_name} failed: {str(e)}")
+
+    def collect(future):
+        job = downloads.pop(future)
+        try:
+            job.file_name = future.result()
+        except Exception as e:
+            job.error = e
+        else:
+            if export_cache is not None:
+                export_cache.put(job.cache_key, job.file_name)
+        finish(job)
+
+    pending = deque()
+    for job in jobs:
+        if export_cache is not None:
+            try:
+                job.cache_key = job.power_bi.export_cache_key(job.format_type, job.page_names, job.report_filter, job.parameter_values)
+            except Exception as e:
+                print(f"Export cache lookup skipped for {job.power_bi.report_name}: {str(e)}")
+            file_name = job.file_name or f"{job.power_bi.report_name}.{job.format_type.lower()}"
+            if export_cache.get(job.cache_key, file_name) is not None:
+                job.file_name = file_name
+                job.status = "Succeeded"
+                finish(job)
+                continue
+        pending.append(job)
+
+    in_flight = []
+    downloads = {}
+    with ThreadPoolExecutor(max_workers=max_download_workers) as download_pool:
+        while pending or in_flight:
+            waiting = deque()
+            for job in pending:
+                semaphore = _capacity_semaphore(job.capacity_key)
+                if not semaphore.acquire(blocking=False):
+                    waiting.append(job)
+                    continue
+                try:
+                    job.export_id = job.power_bi.start_export(job.format_type, job.page_names, job.report_filter, job.parameter_values)
+                    job.started = time.monotonic()
+                    in_flight.append(job)
+                except Exception as e:
+                    job.error = e
+                    job.status = "Failed"
+                    semaphore.release()
+                    finish(job)
+            pending = waiting
+
+            if not in_flight and not pending:
+                break
+            time.sleep(poll_interval)
+
+            for job in list(in_flight):
+                try:
+                    job.status = job.power_bi.get_export_status(job.export_id)
+                except Exception as e:
+                    job.error = e
+                    job.status = "Failed"
+                timed_out = time.monotonic() - job.started > timeout_seconds
+                if job.status not in ["Succeeded", "Failed"] and not timed_out:
+                    continue
+                in_flight.remove(job)
+                _capacity_semaphore(job.capacity_key).release()
+                get_run_metrics().record_phase('export', time.monotonic() - job.started, report=job.power_bi.report_name, format=job.format_type, status=job.status)
+                if job.status == "Succeeded":
+                    print(f"Export of {job.power_bi.report_name} ({job.format_type}) succeeded, downloading file...")
+                    downloads[download_pool.submit(bind_run_metrics(job.power_bi.download_export), job.export_id, job.format_type, job.file_name)] = job
+                else:
+                    if job.error is None:
+                        job.error = ValueError("Export failed" if job.status == "Failed" else "Export timed out")
+                    finish(job)
+
+            for future in [future for future in downloads if future.done()]:
+                collect(future)
+
+        wait(list(downloads))
+        for future in list(downloads):
+            collect(future)
+    return jobs
+
+
+def export_files(power_bi, formats: list, page_names: list = None, export_cache=None) -> list:
+    """
+    Exports one report in several formats at once and returns the file paths in `formats` order.
+    Raises the first error if any export failed.
+    """
+    jobs = run_exports([ExportJob(power_bi, format_type, page_names) for format_type in formats], export_cache=export_cache)
+    for job in jobs:
+        if job.error is not None:
+            print(f"Error during report export: {str(job.error)}")
+            raise job.error
+    return [job.file_name for job in jobs]
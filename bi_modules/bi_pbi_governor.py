@@ -0,0 +1,183 @@
+import asyncio
+import re
+import threading
+import time
+
+
+################################################################################################################################
+# Client-side rate governor for the Power BI REST API.
+#
+# Requests are grouped into endpoint families (refresh, export, query, metadata) and by
+# workspace. Each family and each workspace has a token bucket; a request waits (queues) until
+# both have capacity instead of being sent and throttled. When the service still answers 429,
+# bi_http reports the Retry-After back here and the whole family/workspace pauses for that long.
+
+DEFAULT_FAMILY_LIMITS = {  # requests per minute
+    'refresh': 30,
+    'export': 60,
+    'query': 60,
+    'metadata': 200,
+}
+DEFAULT_WORKSPACE_LIMIT = 120  # requests per minute per workspace
+
+_GROUP_ID = re.compile(r'/groups/([0-9a-fA-F-]{36})')
+
+
+class TokenBucket:
+    """Allows `rate_per_minute` takes per minute with bursts up to `capacity`."""
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or max(1, rate_per_minute / 6)  # ~10 seconds worth of burst
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self) -> float:
+        """Takes a token and returns 0, or returns the seconds until one is available."""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def give_back(self):
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+
+class PowerBiGovernor:
+    """
+    Paces Power BI API calls per endpoint family and per workspace, and honours Retry-After.
+
+    Used as the `rate_limiter` of bi_http.request (acquire) and bi_pbi_async.async_request
+    (acquire_async). stats() shows how many requests are queued
+    right now and how often the service throttled us, which is what concurrency settings
+    (report_refresh max_concurrency, export capacity limits) should be sized against.
+    """
+    def __init__(self, family_limits: dict = None, workspace_limit: float = DEFAULT_WORKSPACE_LIMIT):
+        self.family_limits = dict(DEFAULT_FAMILY_LIMITS, **(family_limits or {}))
+        self.workspace_limit = workspace_limit
+        self._family_buckets = {family: TokenBucket(limit) for family, limit in self.family_limits.items()}
+        self._workspace_buckets = {}
+        self._paused_until = {}
+        self._lock = threading.Lock()
+        self._queue_depth = {family: 0 for family in self.family_limits}
+        self._requests = {family: 0 for family in self.family_limits}
+        self._throttled = {family: 0 for family in self.family_limits}
+        self._wait_seconds = {family: 0.0 for family in self.family_limits}
+
+    @staticmethod
+    def classify(method: str, url: str):
+        """Returns (endpoint family, workspace id or None) for a Power BI REST URL."""
+        match = _GROUP_ID.search(url)
+        workspace_id = match.group(1).lower() if match else None
+        path = url.split('?')[0]
+        if '/refreshes' in path:
+            family = 'refresh'
+        elif '/ExportTo' in path or '/exports/' in path:
+            family = 'export'
+        elif '/executeQueries' in path:
+            family = 'query'
+        else:
+            family = 'metadata'
+        return family, workspace_id
+
+    def try_acquire(self, method: str, url: str) -> float:
+        """Reserves capacity for one request and returns 0, or returns how long to wait before retrying."""
+        family, workspace_id = self.classify(method, url)
+        now = time.monotonic()
+        with self._lock:
+            paused = max(self._paused_until.get(family, 0), self._paused_until.get(workspace_id, 0))
+            if paused > now:
+                return paused - now
+            wait = self._family_buckets[family].try_take()
+            if wait:
+                return wait
+            if workspace_id is not None and self.workspace_limit:
+                bucket = self._workspace_buckets.setdefault(workspace_id, TokenBucket(self.workspace_limit))
+                wait = bucket.try_take()
+                if wait:
+                    self._family_buckets[family].give_back()
+                    return wait
+            self._requests[family] += 1
+            return 0
+
+    def _enter_queue(self, method: str, url: str):
+        family, _ = self.classify(method, url)
+        with self._lock:
+            self._queue_depth[family] += 1
+        return family, time.monotonic()
+
+    def _leave_queue(self, family: str, started: float):
+        with self._lock:
+            self._queue_depth[family] -= 1
+            self._wait_seconds[family] += time.monotonic() - started
+
+    def acquire(self, method: str, url: str):
+        """Blocks until the request may be sent."""
+        family, started = self._enter_queue(method, url)
+        try:
+            while True:
+                wait = self.try_acquire(method, url)
+                if not wait:
+                    return
+                time.sleep(min(wait, 5))
+        finally:
+            self._leave_queue(family, started)
+
+    async def acquire_async(self, method: str, url: str):
+        """Waits without blocking the event loop until the request may be sent; counted in stats() like acquire."""
+        family, started = self._enter_queue(method, url)
+        try:
+            while True:
+                wait = self.try_acquire(method, url)
+                if not wait:
+                    return
+                await asyncio.sleep(min(wait, 5))
+        finally:
+            self._leave_queue(family, started)
+
+    def on_throttled(self, method: str, url: str, retry_after: float):
+        """Pauses the request's family and workspace for `retry_after` seconds after a 429."""
+        family, workspace_id = self.classify(method, url)
+        until = time.monotonic() + retry_after
+        with self._lock:
+            self._throttled[family] += 1
+            self._paused_until[family] = max(self._paused_until.get(family, 0), until)
+            if workspace_id is not None:
+                self._paused_until[workspace_id] = max(self._paused_until.get(workspace_id, 0), until)
+        print(f"Power BI throttled {family} requests, pausing for {retry_after:.0f}s")
+
+    def stats(self) -> dict:
+        """Current queue depth plus request, throttle and wait totals per endpoint family."""
+        with self._lock:
+            return {
+                'queue_depth': dict(self._queue_depth),
+                'requests': dict(self._requests),
+                'throttled': dict(self._throttled),
+                'wait_seconds': {family: round(seconds, 1) for family, seconds in self._wait_seconds.items()},
+            }
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_governor() -> PowerBiGovernor:
+    """Returns the process-wide governor shared by every PowerBiRefresh."""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = PowerBiGovernor()
+        return _governor
+
+
+def configure_governor(family_limits: dict = None, workspace_limit: float = DEFAULT_WORKSPACE_LIMIT) -> PowerBiGovernor:
+    """Replaces the process-wide governor with one using the given per-minute limits."""
+    global _governor
+    with _governor_lock:
+        _governor = PowerBiGovernor(family_limits, workspace_limit)
+        return _governor
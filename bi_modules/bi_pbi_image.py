@@ -0,0 +1,130 @@
+import io
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from PIL import Image
+
+
+################################################################################################################################
+# Post-processing for exported report images before they are emailed.
+#
+# A PNG export of several pages arrives as a zip with one PNG per page. The pages are pulled
+# out, optionally stitched into one tall image, downscaled to the width an email client shows
+# anyway, and re-encoded with whichever format comes out smallest, so large distributions stay
+# fast to send and under mailbox size limits.
+
+IMAGE_FORMATS = ('auto', 'PNG', 'JPEG', 'WEBP')
+IMAGE_SUFFIXES = {'PNG': '.png', 'JPEG': '.jpg', 'WEBP': '.webp'}
+
+
+class ImageProcessing:
+    """
+    Settings for process_report_image.
+
+    Args:
+        max_width: Downscale wider pages to this many pixels (None keeps the original size).
+        stitch: Join the pages of a multi-page export into one image, top to bottom.
+        format: 'PNG' (optimized), 'JPEG', 'WEBP', or 'auto' to keep whichever of an optimized
+            PNG and a JPEG is smaller. WebP is only used when asked for, since Outlook desktop
+            doesn't render it.
+        jpeg_quality: Quality for JPEG and WebP output.
+        max_bytes: When a result is still larger than this, retry as JPEG with lower quality.
+    """
+    def __init__(self, max_width: int = 1200, stitch: bool = True, format: str = 'auto', jpeg_quality: int = 85, max_bytes: int = None):
+        if format not in IMAGE_FORMATS:
+            raise ValueError(f"Image format must be one of {IMAGE_FORMATS}, got {format!r}")
+        self.max_width = max_width
+        self.stitch = stitch
+        self.format = format
+        self.jpeg_quality = jpeg_quality
+        self.max_bytes = max_bytes
+
+
+def load_pages(path: str) -> list:
+    """Opens an exported image, or every image in an exported zip (in page order)."""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            names = sorted(name for name in archive.namelist() if Path(name).suffix.lower() in ('.png', '.jpg', '.jpeg'))
+            pages = []
+            for name in names:
+                page = Image.open(io.BytesIO(archive.read(name)))
+                page.load()
+                pages.append(page)
+            return pages
+    with Image.open(path) as page:
+        page.load()
+        return [page]
+
+
+def stitch_pages(pages: list) -> Image.Image:
+    """Stacks pages top to bottom on a white background."""
+    width = max(page.width for page in pages)
+    stitched = Image.new('RGB', (width, sum(page.height for page in pages)), 'white')
+    top = 0
+    for page in pages:
+        stitched.paste(page.convert('RGB'), (0, top))
+        top += page.height
+    return stitched
+
+
+def downscale(page: Image.Image, max_width: int) -> Image.Image:
+    if not max_width or page.width <= max_width:
+        return page
+    height = round(page.height * max_width / page.width)
+    return page.resize((max_width, height), Image.LANCZOS)
+
+
+def encode(page: Image.Image, format: str, quality: int = 85) -> bytes:
+    buffer = io.BytesIO()
+    if format == 'PNG':
+        page.save(buffer, 'PNG', optimize=True)
+    elif format == 'JPEG':
+        page.convert('RGB').save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True)
+    else:
+        page.save(buffer, 'WEBP', quality=quality, method=6)
+    return buffer.getvalue()
+
+
+def _smallest_encoding(page: Image.Image, options: ImageProcessing):
+    if options.format == 'auto':
+        candidates = [('PNG', encode(page, 'PNG')), ('JPEG', encode(page, 'JPEG', options.jpeg_quality))]
+        format, data = min(candidates, key=lambda candidate: len(candidate[1]))
+    else:
+        format, data = options.format, encode(page, options.format, options.jpeg_quality)
+    quality = options.jpeg_quality
+    while options.max_bytes and len(data) > options.max_bytes and quality > 40:
+        quality -= 15
+        format, data = 'JPEG', encode(page, 'JPEG', quality)
+    return format, data
+
+
+def process_report_image(path: str, options: ImageProcessing = None) -> list:
+    """
+    Splits, stitches, downscales and recompresses one exported image (or zip of page images)
+    and returns the paths of the resulting files, written next to the original.
+    """
+    options = options or ImageProcessing()
+    pages = load_pages(path)
+    if not pages:
+        raise ValueError(f"No images found in {path}")
+    if options.stitch and len(pages) > 1:
+        pages = [stitch_pages(pages)]
+
+    source = Path(path)
+    before = source.stat().st_size
+    outputs = []
+    for number, page in enumerate(pages, start=1):
+        format, data = _smallest_encoding(downscale(page, options.max_width), options)
+        stem = source.stem if len(pages) == 1 else f"{source.stem}_page{number}"
+        target = source.with_name(stem + IMAGE_SUFFIXES[format])
+        target.write_bytes(data)
+        outputs.append(str(target))
+    after = sum(Path(output).stat().st_size for output in outputs)
+    print(f"Processed {source.name}: {len(outputs)} image(s), {before} -> {after} bytes")
+    return outputs
+
+
+def process_report_images(paths: list, options: ImageProcessing = None, max_workers: int = 4) -> list:
+    """Runs process_report_image over many exports in a worker pool; returns one list of paths per input."""
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(paths)))) as executor:
+        return list(executor.map(lambda path: process_report_image(path, options), paths))
@@ -0,0 +1,258 @@
+import contextvars
+import functools
+import json
+import os
+import re
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+
+################################################################################################################################
+# Per-run latency instrumentation for the Power BI helpers.
+#
+# bi_http reports every API call here (endpoint, status, latency, retries, bytes) and
+# PowerBiRefresh/run_exports time their phases (token, refresh wait, export, download). At the
+# end of a run the calls and phases are aggregated into latency histograms and published as a
+# Prefect markdown artifact plus a structured log line, and appended to a JSON-lines file when
+# PBI_METRICS_JSONL is set.
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)  # seconds
+METRICS_JSONL_ENV = "PBI_METRICS_JSONL"
+PROCESS_METRICS_MAX_RECORDS = 10000  # calls and phases each kept by the collector used outside any run
+
+_GUID = re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}')
+
+
+def endpoint_label(method: str, url: str) -> str:
+    """'GET https://api.powerbi.com/v1.0/myorg/groups/<guid>/reports' -> 'GET /groups/{id}/reports'."""
+    parts = urlsplit(url)
+    path = _GUID.sub('{id}', parts.path)
+    if '/myorg' in path:
+        path = path.split('/myorg', 1)[1] or '/'
+    else:
+        path = parts.netloc + path
+    return f"{method.upper()} {path}"
+
+
+def _histogram(latencies: list) -> dict:
+    ordered = sorted(latencies)
+    buckets = {}
+    for bound in LATENCY_BUCKETS:
+        buckets[f"<={bound}s"] = sum(1 for latency in ordered if latency <= bound)
+    buckets[f">{LATENCY_BUCKETS[-1]}s"] = sum(1 for latency in ordered if latency > LATENCY_BUCKETS[-1])
+    return {
+        'count': len(ordered),
+        'total_seconds': round(sum(ordered), 3),
+        'p50': round(statistics.median(ordered), 3),
+        'p90': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))], 3),
+        'p99': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 3),
+        'max': round(ordered[-1], 3),
+        'buckets': buckets,
+    }
+
+
+class RunMetrics:
+    """
+    Collects API calls and phase timings for one run. Thread-safe; every PowerBiRefresh used
+    within the run records into the same instance (see get_run_metrics). With `max_records`
+    only the most recent calls and phases are kept.
+    """
+    def __init__(self, max_records: int = None):
+        self.max_records = max_records
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.calls = deque(maxlen=self.max_records)
+            self.phases = deque(maxlen=self.max_records)
+
+    def record_call(self, method: str, url: str, status_code: int, seconds: float, retries: int = 0, throttled: int = 0, num_bytes: int = None):
+        """Called by bi_http.request once per logical request (after its retries)."""
+        record = {
+            'type': 'call',
+            'time': time.time(),
+            'endpoint': endpoint_label(method, url),
+            'status': status_code,
+            'seconds': round(seconds, 4),
+            'retries': retries,
+            'throttled': throttled,
+            'bytes': num_bytes,
+        }
+        with self._lock:
+            self.calls.append(record)
+
+    def record_phase(self, name: str, seconds: float, num_bytes: int = None, **labels):
+        record = {'type': 'phase', 'time': time.time(), 'phase': name, 'seconds': round(seconds, 4), 'bytes': num_bytes}
+        record.update(labels)
+        with self._lock:
+            self.phases.append(record)
+
+    @contextmanager
+    def phase(self, name: str, **labels):
+        """
+        Times a block as one phase, e.g. `with metrics.phase("refresh_wait", report=name):`.
+        The yielded dict can be updated with extra fields such as num_bytes.
+        """
+        extra = {}
+        started = time.perf_counter()
+        try:
+            yield extra
+        finally:
+            labels.update(extra)
+            self.record_phase(name, time.perf_counter() - started, **labels)
+
+    def summary(self) -> dict:
+        """Latency histograms per endpoint and per phase, plus totals, for the run so far."""
+        with self._lock:
+            calls = list(self.calls)
+            phases = list(self.phases)
+        endpoints = {}
+        for call in calls:
+            endpoints.setdefault(call['endpoint'], []).append(call)
+        phase_groups = {}
+        for phase in phases:
+            phase_groups.setdefault(phase['phase'], []).append(phase)
+
+        summary = {'run_seconds': round(time.time() - self.started, 1), 'calls': len(calls), 'endpoints': {}, 'phases': {}}
+        for endpoint, records in sorted(endpoints.items()):
+            stats = _histogram([record['seconds'] for record in records])
+            stats['errors'] = sum(1 for record in records if record['status'] is None or record['status'] >= 400)
+            stats['retries'] = sum(record['retries'] for record in records)
+            stats['throttled'] = sum(record['throttled'] for record in records)
+            stats['bytes'] = sum(record['bytes'] or 0 for record in records)
+            summary['endpoints'][endpoint] = stats
+        for name, records in sorted(phase_groups.items()):
+            stats = _histogram([record['seconds'] for record in records])
+            stats['bytes'] = sum(record.get('bytes') or 0 for record in records)
+            summary['phases'][name] = stats
+        return summary
+
+    def to_markdown(self, summary: dict = None) -> str:
+        summary = summary or self.summary()
+        lines = [
+            f"**Run time:** {summary['run_seconds']}s, **API calls:** {summary['calls']}",
+            "",
+            "| Phase | Count | Total s | p50 s | p90 s | Max s | Bytes |",
+            "|---|---|---|---|---|---|---|",
+        ]
+        for name, stats in summary['phases'].items():
+            lines.append(f"| {name} | {stats['count']} | {stats['total_seconds']} | {stats['p50']} | {stats['p90']} | {stats['max']} | {stats['bytes']} |")
+        lines += [
+            "",
+            "| Endpoint | Calls | Errors | Retries | 429s | p50 s | p90 s | p99 s | Max s | Bytes |",
+            "|---|---|---|---|---|---|---|---|---|---|",
+        ]
+        for endpoint, stats in summary['endpoints'].items():
+            lines.append(
+                f"| `{endpoint}` | {stats['count']} | {stats['errors']} | {stats['retries']} | {stats['throttled']} "
+                f"| {stats['p50']} | {stats['p90']} | {stats['p99']} | {stats['max']} | {stats['bytes']} |"
+            )
+        return "\n".join(lines)
+
+    def write_jsonl(self, path: str, run_name: str = None, summary: dict = None):
+        """Appends every call and phase record, then the run summary, to a JSON-lines file."""
+        with self._lock:
+            records = list(self.calls) + list(self.phases)
+        with open(path, 'a') as f:
+            for record in sorted(records, key=lambda record: record['time']):
+                f.write(json.dumps(dict(record, run=run_name), default=str) + "\n")
+            f.write(json.dumps({'type': 'summary', 'run': run_name, 'time': time.time(), **(summary or self.summary())}, default=str) + "\n")
+
+    def publish(self, run_name: str = "power-bi", jsonl_path: str = None) -> dict:
+        """
+        Emits the run summary as a Prefect markdown artifact and a structured log line (when
+        running inside a flow), and to `jsonl_path` or $PBI_METRICS_JSONL if set. Returns the summary.
+        """
+        summary = self.summary()
+        if not summary['calls'] and not summary['phases']:
+            return summary
+        markdown = self.to_markdown(summary)
+        try:
+            from prefect import get_run_logger
+            from prefect.artifacts import create_markdown_artifact
+            create_markdown_artifact(
+                key=re.sub(r'[^a-z0-9-]', '-', f"{run_name}-api-metrics".lower()),
+                markdown=markdown,
+                description=f"Power BI API latency for {run_name}"
+            )
+            get_run_logger().info(json.dumps({'power_bi_metrics': run_name, **summary}, default=str))
+        except Exception:
+            # Outside a flow run there's no artifact store or run logger
+            print(f"Power BI API metrics for {run_name}:\n{markdown}")
+
+        jsonl_path = jsonl_path or os.environ.get(METRICS_JSONL_ENV)
+        if jsonl_path:
+            try:
+                self.write_jsonl(jsonl_path, run_name, summary)
+            except OSError as e:
+                print(f"Could not write metrics to {jsonl_path}: {str(e)}")
+        return summary
+
+
+_process_metrics = RunMetrics(max_records=PROCESS_METRICS_MAX_RECORDS)  # Calls made outside any decorated entry point
+_current_metrics = contextvars.ContextVar('pbi_run_metrics', default=None)
+
+
+def get_run_metrics() -> RunMetrics:
+    """
+    Returns the collector of the run this code is part of (see publishes_run_metrics), or a
+    process-wide one outside of any run (direct PowerBiRefresh or AsyncPowerBiRefresh use).
+    The process-wide collector is never published on its own and keeps only the last
+    PROCESS_METRICS_MAX_RECORDS calls and phases; call get_run_metrics().publish(name) and
+    .reset() outside a run to report and clear it, e.g. at the end of a worker loop.
+    """
+    return _current_metrics.get() or _process_metrics
+
+
+def bind_run_metrics(function):
+    """
+    Wraps `function` so it records into the caller's run when it is called from a worker
+    thread, which doesn't inherit the caller's context. Call this in the thread that submits
+    the work, e.g. executor.submit(bind_run_metrics(download), job).
+    """
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return function
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        token = _current_metrics.set(metrics)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _current_metrics.reset(token)
+    return wrapper
+
+
+def publishes_run_metrics(run_name: str):
+    """
+    Decorator for entry points (report_refresh, burst_report...): the outermost decorated call
+    starts its own set of metrics, times itself as the 'run' phase and publishes the summary
+    when it returns or raises. Nested decorated calls just add to the same run. The collector
+    is held in a context variable, so concurrent runs (e.g. two Prefect tasks in one process)
+    each publish only their own calls.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _current_metrics.get() is not None:
+                return function(*args, **kwargs)
+            metrics = RunMetrics()
+            token = _current_metrics.set(metrics)
+            try:
+                with metrics.phase('run', entry_point=run_name):
+                    return function(*args, **kwargs)
+            finally:
+                _current_metrics.reset(token)
+                try:
+                    metrics.publish(run_name)
+                except Exception as e:
+                    print(f"Could not publish Power BI metrics: {str(e)}")
+        return wrapper
+    return decorator
@@ -0,0 +1,192 @@
+import datetime
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+try:
+    from . import bi_http
+except:
+    import bi_http
+try:
+    from .bi_pbi_governor import get_governor
+except:
+    from bi_pbi_governor import get_governor
+try:
+    from .bi_pbi_metrics import get_run_metrics
+except:
+    from bi_pbi_metrics import get_run_metrics
+try:
+    from .bi_pbi import PBI_API_URL, PowerBiTokenManager, get_token_manager, refresh_status_from_history, estimate_refresh_duration, AdaptivePollSchedule, REFRESH_TERMINAL_STATUSES
+except:
+    from bi_pbi import PBI_API_URL, PowerBiTokenManager, get_token_manager, refresh_status_from_history, estimate_refresh_duration, AdaptivePollSchedule, REFRESH_TERMINAL_STATUSES
+
+
+################################################################################################################################
+
+class WatchedRefresh:
+    """One in-flight dataset refresh tracked by a RefreshPoller."""
+    def __init__(self, group_id: str, dataset_id: str, request_id: str = None, triggered_at: datetime.datetime = None, timeout_seconds: int = 3600, name: str = None):
+        self.group_id = group_id
+        self.dataset_id = dataset_id
+        self.request_id = request_id
+        self.triggered_at = triggered_at  # None follows the newest history entry
+        self.watched_at = datetime.datetime.now(datetime.timezone.utc)
+        self.deadline = time.monotonic() + timeout_seconds
+        self.name = name or dataset_id
+        self.schedule = None
+        self.status = None
+        self.polls = 0
+        self.future = Future()
+        self.metrics = get_run_metrics()  # The watching run's collector; the poller thread has no run of its own
+
+    def elapsed_seconds(self) -> float:
+        return (datetime.datetime.now(datetime.timezone.utc) - (self.triggered_at or self.watched_at)).total_seconds()
+
+
+class RefreshPoller:
+    """
+    Watches many refreshes from a single background thread.
+
+    Each watched refresh gets its own AdaptivePollSchedule (seeded from its dataset's refresh
+    history on the first check), and every status call draws from one shared budget of
+    `requests_per_minute`, so watching N refreshes costs at most that many calls per minute no
+    matter how large N is. watch() returns a concurrent.futures.Future that resolves to the
+    terminal status ('Completed', 'Failed', ...) or to the last seen status on timeout.
+
+    Usage:
+        poller = RefreshPoller()
+        future = poller.watch_refresh(power_bi)   # after power_bi.refresh_power_bi_dataset()
+        status = future.result()
+    """
+    def __init__(self, requests_per_minute: int = 60, history_size: int = 10, token_manager: PowerBiTokenManager = None):
+        self.requests_per_minute = requests_per_minute
+        self.history_size = history_size
+        self.token_manager = token_manager or get_token_manager()
+        self._queue = []  # heap of (next poll time, sequence, WatchedRefresh)
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self._budget = float(requests_per_minute)
+        self._budget_updated = time.monotonic()
+
+    def watch(self, group_id: str, dataset_id: str, request_id: str = None, triggered_at: datetime.datetime = None, timeout_seconds: int = 3600, callback=None, name: str = None) -> Future:
+        """
+        Starts watching a refresh. `callback`, if given, is called with the Future once it resolves.
+        `request_id` is the enhanced refresh id; without it the newest history entry after
+        `triggered_at` is followed, or simply the newest entry when triggered_at is None (the
+        refresh POST was rejected, e.g. because a refresh was already in progress).
+        """
+        handle = WatchedRefresh(group_id, dataset_id, request_id, triggered_at, timeout_seconds, name)
+        if callback is not None:
+            handle.future.add_done_callback(callback)
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError("RefreshPoller has been shut down")
+            heapq.heappush(self._queue, (time.monotonic(), next(self._sequence), handle))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="pbi-refresh-poller", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return handle.future
+
+    def watch_refresh(self, power_bi, timeout_seconds: int = None, callback=None) -> Future:
+        """Watches the refresh last triggered by a PowerBiRefresh instance."""
+        if timeout_seconds is None:
+            timeout_seconds = power_bi.number_of_tries * 60
+        return self.watch(
+            power_bi.group_id,
+            power_bi.dataset_id,
+            request_id=power_bi.refresh_request_id,
+            triggered_at=power_bi.refresh_triggered_at,
+            timeout_seconds=timeout_seconds,
+            callback=callback,
+            name=power_bi.report_name
+        )
+
+    def pending(self) -> int:
+        with self._condition:
+            return len(self._queue)
+
+    def shutdown(self, wait: bool = True):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if wait and self._thread is not None:
+            self._thread.join()
+
+    def _take_budget(self):
+        # Token bucket refilled at requests_per_minute; blocks the poller thread when empty
+        while True:
+            now = time.monotonic()
+            self._budget = min(self.requests_per_minute, self._budget + (now - self._budget_updated) * self.requests_per_minute / 60)
+            self._budget_updated = now
+            if self._budget >= 1:
+                self._budget -= 1
+                return
+            time.sleep((1 - self._budget) * 60 / self.requests_per_minute)
+
+    def _check(self, handle: WatchedRefresh):
+        base_url = f"{PBI_API_URL}/groups/{handle.group_id}/datasets/{handle.dataset_id}/refreshes"
+        if handle.request_id is not None and handle.schedule is not None:
+            response = bi_http.get(f"{base_url}/{handle.request_id}", token_provider=self.token_manager.bearer, rate_limiter=get_governor(), metrics=handle.metrics)
+            if response.status_code == 200:
+                return response.json().get('status')
+            return None
+        top = self.history_size if handle.schedule is None else 1
+        response = bi_http.get(f"{base_url}?$top={top}", token_provider=self.token_manager.bearer, rate_limiter=get_governor(), metrics=handle.metrics)
+        if response.status_code != 200:
+            return None
+        history = response.json()['value']
+        if handle.schedule is None:
+            handle.schedule = AdaptivePollSchedule(*estimate_refresh_duration(history))
+        return refresh_status_from_history(history, handle.triggered_at)
+
+    def _next_poll_time(self, handle: WatchedRefresh) -> float:
+        if handle.polls == 1:
+            delay = handle.schedule.first_delay(handle.elapsed_seconds())
+        else:
+            delay = handle.schedule.next_delay(handle.elapsed_seconds())
+        return min(time.monotonic() + delay, handle.deadline)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped and (not self._queue or self._queue[0][0] > time.monotonic()):
+                    self._condition.wait(timeout=self._queue[0][0] - time.monotonic() if self._queue else None)
+                if self._stopped:
+                    for _, _, handle in self._queue:
+                        handle.future.set_result(handle.status)
+                    self._queue = []
+                    return
+                _, _, handle = heapq.heappop(self._queue)
+
+            self._take_budget()
+            try:
+                handle.status = self._check(handle)
+            except Exception as e:
+                print(f"Status check for {handle.name} failed: {str(e)}")
+            handle.polls += 1
+            if handle.schedule is None:
+                handle.schedule = AdaptivePollSchedule()
+
+            if handle.status in REFRESH_TERMINAL_STATUSES or time.monotonic() >= handle.deadline:
+                print(f"Status Check for {handle.name}: {handle.status}")
+                handle.future.set_result(handle.status)
+                continue
+            with self._condition:
+                heapq.heappush(self._queue, (self._next_poll_time(handle), next(self._sequence), handle))
+
+
+_refresh_poller = None
+_refresh_poller_lock = threading.Lock()
+
+
+def get_refresh_poller() -> RefreshPoller:
+    """Returns the process-wide RefreshPoller."""
+    global _refresh_poller
+    with _refresh_poller_lock:
+        if _refresh_poller is None:
+            _refresh_poller = RefreshPoller()
+        return _refresh_poller
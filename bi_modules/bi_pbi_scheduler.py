@@ -0,0 +1,151 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+################################################################################################################################
+
+class RefreshPlan:
+    """
+    Dependency graph of reports to refresh.
+
+    Every node starts as soon as all of its dependencies have succeeded (up to `max_concurrency`
+    at once), so the total runtime follows the critical path rather than the sum of all nodes.
+    When a node fails, everything downstream of it is skipped; independent branches keep going.
+
+    Args:
+        nodes: {name: payload}; the payload is what run_node receives (a reports.yaml entry).
+        dependencies: {name: [names it depends on]}.
+
+    Raises:
+        ValueError: when a dependency is not in the plan or the graph has a cycle.
+    """
+    def __init__(self, nodes: dict, dependencies: dict = None):
+        self.nodes = nodes
+        self.dependencies = {name: list((dependencies or {}).get(name) or []) for name in nodes}
+        self.dependents = {name: [] for name in nodes}
+        for name, upstream in self.dependencies.items():
+            for dependency in upstream:
+                if dependency not in nodes:
+                    raise ValueError(f"{name} depends on {dependency}, which is not in the plan")
+                self.dependents[dependency].append(name)
+        self._waves = self._compute_waves()
+
+    @classmethod
+    def from_reports(cls, reports: list):
+        """
+        Builds a plan from reports.yaml entries using their `depends_on` lists. Nodes are keyed by
+        report name, or by 'group_name/name' when the same report is listed in several workspaces
+        (numbered when an entry is repeated outright); `depends_on` can use either form, but must
+        not name a report that is listed more than once under that form.
+        """
+        name_counts = {}
+        for report in reports:
+            name_counts[report.get('name')] = name_counts.get(report.get('name'), 0) + 1
+        nodes = {}
+        aliases = {}  # 'group_name/name' -> node key
+        for report in reports:
+            name = report.get('name')
+            qualified = f"{report.get('group_name')}/{name}"
+            key = name if name_counts[name] == 1 else qualified
+            if key in nodes:
+                aliases[qualified] = None  # Repeated entry, can't be depended on
+                key = f"{qualified} ({sum(1 for node in nodes if node == qualified or node.startswith(qualified + ' (')) + 1})"
+            else:
+                aliases[qualified] = key
+            nodes[key] = report
+
+        dependencies = {}
+        for key, report in nodes.items():
+            depends_on = report.get('depends_on') or []
+            depends_on = [depends_on] if isinstance(depends_on, str) else depends_on
+            for dependency in depends_on:
+                if name_counts.get(dependency, 0) > 1 and dependency not in aliases:
+                    raise ValueError(f"{key} depends on {dependency}, which is listed in several workspaces; use group_name/name")
+                if dependency in aliases and aliases[dependency] is None:
+                    raise ValueError(f"{key} depends on {dependency}, which is listed more than once")
+            dependencies[key] = [aliases.get(dependency, dependency) for dependency in depends_on]
+        return cls(nodes, dependencies)
+
+    def _compute_waves(self) -> list:
+        # Kahn's algorithm, grouped by depth
+        remaining = {name: len(upstream) for name, upstream in self.dependencies.items()}
+        wave = [name for name, count in remaining.items() if count == 0]
+        waves = []
+        while wave:
+            waves.append(wave)
+            next_wave = []
+            for name in wave:
+                for dependent in self.dependents[name]:
+                    remaining[dependent] -= 1
+                    if remaining[dependent] == 0:
+                        next_wave.append(dependent)
+            wave = next_wave
+        if sum(len(wave) for wave in waves) != len(self.nodes):
+            cyclic = sorted(name for name in self.nodes if not any(name in wave for wave in waves))
+            raise ValueError(f"Dependency cycle between: {', '.join(cyclic)}")
+        return waves
+
+    def waves(self) -> list:
+        """Topological levels: every node's dependencies are in an earlier wave."""
+        return [list(wave) for wave in self._waves]
+
+    def run(self, run_node, max_concurrency: int = 10) -> dict:
+        """
+        Runs run_node(payload) for every node and returns {name: {'status', 'error', 'seconds'}},
+        where status is 'Succeeded', 'Failed' or 'Skipped'. run_node reports a failure by
+        raising; a node whose run_node returns normally counts as succeeded.
+        """
+        for number, wave in enumerate(self._waves, start=1):
+            print(f"Refresh plan wave {number}: {', '.join(map(str, wave))}")
+
+        results = {}
+        remaining = {name: set(upstream) for name, upstream in self.dependencies.items()}
+        ready = list(self._waves[0]) if self._waves else []
+        started = {}
+
+        def skip_downstream(name):
+            stack = list(self.dependents[name])
+            while stack:
+                dependent = stack.pop()
+                if dependent in results:
+                    continue
+                results[dependent] = {'status': 'Skipped', 'error': f"upstream {name} failed", 'seconds': 0}
+                stack.extend(self.dependents[dependent])
+
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            futures = {}
+            while ready or futures:
+                for name in ready:
+                    started[name] = time.monotonic()
+                    futures[executor.submit(run_node, self.nodes[name])] = name
+                ready = []
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = futures.pop(future)
+                    seconds = time.monotonic() - started[name]
+                    try:
+                        future.result()
+                    except Exception as e:
+                        print(f"Error refreshing {name}: {str(e)}")
+                        results[name] = {'status': 'Failed', 'error': str(e), 'seconds': seconds}
+                        skip_downstream(name)
+                        continue
+                    print(f"Finished {name} in {seconds:.0f}s")
+                    results[name] = {'status': 'Succeeded', 'error': None, 'seconds': seconds}
+                    for dependent in self.dependents[name]:
+                        remaining[dependent].discard(name)
+                        if not remaining[dependent] and dependent not in results:
+                            ready.append(dependent)
+        return results
+
+
+def summarize_plan_results(results: dict) -> str:
+    """One line per node, e.g. 'Sales Dashboard: Failed (...)', for logs and emails."""
+    lines = []
+    for name, result in results.items():
+        line = f"{name}: {result['status']}"
+        if result['error']:
+            line += f" ({result['error']})"
+        lines.append(line)
+    return '\n'.join(lines)